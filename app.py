@@ -1,11 +1,44 @@
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 import os
+import sys
 import time
 import math
+import random
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import codecs
 import re
-from collections import defaultdict
+import heapq
+import bisect
+import gc
+import hashlib
+import hmac
+import gzip
+import pickle
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Mapping
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: every process refreshes for itself
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # scoring falls back to the plain dict loops
+    np = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
 
 # =================================================
 # APP SETUP
@@ -13,10 +46,40 @@ from collections import defaultdict
 
 app = Flask(__name__)
 
-GOOGLE_PROFILES_FEED = os.environ["GOOGLE_PROFILES_FEED"]
-
-CACHE = {"profiles": None, "ts": 0}
+# Rows come from HUDs via POST /ingest and/or from the sheet feed, which is
+# optional and acts as the backfill / source of record when set.
+GOOGLE_PROFILES_FEED = os.environ.get("GOOGLE_PROFILES_FEED", "")
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN", "")                   # X-Ingest-Token; /ingest is off without one
+INGEST_BUFFER = int(os.environ.get("INGEST_BUFFER", 50000))         # ring buffer size (rows)
+INGEST_MAX_BATCH = int(os.environ.get("INGEST_MAX_BATCH", 500))     # rows per POST
+INGEST_FLUSH = float(os.environ.get("INGEST_FLUSH", 5))             # s between folding pushed rows in
+INGEST_PUBLISH = float(os.environ.get("INGEST_PUBLISH", 60))        # s between push-only snapshot publishes
+INGEST_RETENTION = int(os.environ.get("INGEST_RETENTION", 7 * 86400))  # pushed rows the feed never lists
+INGEST_SKEW = int(os.environ.get("INGEST_SKEW", 300))              # s a pushed timestamp may run ahead
+ACTIVITY_PUBLISH = float(os.environ.get("ACTIVITY_PUBLISH", 5))     # s between platform activity publishes
+
+CACHE = {"snapshot": None, "activity": None}
 CACHE_TTL = 300
+REFRESH_AHEAD = int(os.environ.get("REFRESH_AHEAD", 60))   # rebuild this long before expiry
+REFRESH_RETRY = int(os.environ.get("REFRESH_RETRY", 15))   # backoff after a failed rebuild
+REFRESH_RETRY_MAX = int(os.environ.get("REFRESH_RETRY_MAX", 300))   # backoff doubles up to this
+
+# One rebuild shared by all gunicorn workers; set SNAPSHOT_PATH="" to rebuild per-process.
+# Point it at a persistent disk to keep snapshots (and scoring state) across deploys.
+# The files are pickles: keep them in a directory only this user can write.
+def _default_snapshot_path():
+    folder = os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "sl-gpt-relay"
+    )
+    try:
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+    except OSError:
+        return ""   # nowhere private to share through
+    return os.path.join(folder, "snapshot")
+
+SNAPSHOT_PATH = os.environ["SNAPSHOT_PATH"] if "SNAPSHOT_PATH" in os.environ else _default_snapshot_path()
+SNAPSHOT_POLL = int(os.environ.get("SNAPSHOT_POLL", 5))
+STATE_SAVE_INTERVAL = int(os.environ.get("STATE_SAVE_INTERVAL", 60))   # s between scoring-state saves
 NOW = time.time()
 
 
@@ -185,13 +248,114 @@ def row(icon, label, value):
 # HELPERS
 # =================================================
 
+# Rows lose weight as they age. By default the weight halves every
+# DECAY_HALF_LIFE seconds (48h puts a day-old row at ~0.7, like the old middle
+# step). DECAY_MODE=step keeps the original buckets: 1.0 within the hour,
+# 0.7 within the day, 0.4 after that.
+DECAY_MODE = os.environ.get("DECAY_MODE", "exponential")
+STEP_DECAY = DECAY_MODE == "step"
+
+DECAY_EDGES = (3600, 86400)        # row age (s) at which it drops to the next weight
+DECAY_WEIGHTS = (1.0, 0.7, 0.4)
+
+DECAY_HALF_LIFE = float(os.environ.get("DECAY_HALF_LIFE", 48 * 3600))
+RECENT_WINDOW = 3600               # s; "recent" counts the last hour's messages
+DECAY_STALE = int(os.environ.get("DECAY_STALE", 300))   # s a profile may trail its decaying weights
+
+def decay_bucket(age):
+    for i, edge in enumerate(DECAY_EDGES):
+        if age <= edge:
+            return i
+    return len(DECAY_EDGES)
+
+# row ages at which a row moves to its next bucket: the decay steps, or just
+# out of the "recent" hour when decay is exponential
+ROW_EDGES = DECAY_EDGES if STEP_DECAY else (RECENT_WINDOW,)
+
+def row_bucket(age):
+    for i, edge in enumerate(ROW_EDGES):
+        if age <= edge:
+            return i
+    return len(ROW_EDGES)
+
+def decay_weight(age):
+    if STEP_DECAY:
+        return DECAY_WEIGHTS[decay_bucket(age)]
+    return 2.0 ** (-max(age, 0.0) / DECAY_HALF_LIFE)
+
 def decay(ts):
-    age_hrs = (time.time() - ts) / 3600
-    if age_hrs <= 1:
-        return 1.0
-    if age_hrs <= 24:
-        return 0.7
-    return 0.4
+    return decay_weight(time.time() - ts)
+
+
+# =================================================
+# PHRASE MATCHER (COMPILED ONCE AT STARTUP)
+# =================================================
+# Text and lexicon entries go through the same tokenizer: words (keeping
+# inner apostrophes, so "don't" is one token), runs of ASCII punctuation
+# ("<3" -> "<","3"; "???" stays whole) and single emoji. Every entry becomes a
+# token sequence in one Aho-Corasick automaton, so "shut up", "o/", "😂" and
+# "holy shit" all match in a single pass over the message. Within each
+# category, matches are then taken leftmost-longest and never overlap, so
+# "shut up" is one combative hit rather than also "shut" and "up"; a match
+# never hides one of another category ("hey sexy" is flirty, and its "hey"
+# is still engaging).
+
+TOKEN_RE = re.compile(r"\w+(?:['’]\w+)*|[!-/:-@\[-`{-~]+|[^\w\s]\ufe0f?")
+
+LEXICONS = {
+    "engaging": ENGAGING,
+    "curious": CURIOUS,
+    "humorous": HUMOR,
+    "supportive": SUPPORT,
+    "dominant": DOMINANT,
+    "combative": COMBATIVE,
+    "flirty": FLIRTY,
+    "sexual": SEXUAL,
+    "curse": CURSE,
+}
+
+NEGATION_WINDOW = 3   # tokens before a match that a negator reaches back over
+
+
+def compile_phrases(lexicons, negators):
+    phrases = defaultdict(lambda: [set(), False])
+    for cat, words in lexicons.items():
+        for w in words:
+            tokens = tuple(TOKEN_RE.findall(w.lower()))
+            if tokens:
+                phrases[tokens][0].add(cat)
+    for w in negators:
+        tokens = tuple(TOKEN_RE.findall(w.lower()))
+        if tokens:
+            phrases[tokens][1] = True
+
+    goto, fail, out = [{}], [0], [()]
+    for tokens, (cats, negates) in phrases.items():
+        node = 0
+        for tok in tokens:
+            if tok not in goto[node]:
+                goto[node][tok] = len(goto)
+                goto.append({})
+                fail.append(0)
+                out.append(())
+            node = goto[node][tok]
+        out[node] = ((len(tokens), tuple(sorted(cats)), negates),)
+
+    # breadth-first so every fail target is finished before it is used
+    queue = list(goto[0].values())
+    for node in queue:
+        for tok, child in goto[node].items():
+            f = fail[node]
+            while f and tok not in goto[f]:
+                f = fail[f]
+            fail[child] = goto[f].get(tok, 0)
+            out[child] = out[child] + out[fail[child]]
+            queue.append(child)
+
+    return goto, fail, out
+
+
+PHRASE_MATCHER = compile_phrases(LEXICONS, NEGATORS)
 
 
 def extract_hits(text):
@@ -200,44 +364,343 @@ def extract_hits(text):
     if not text:
         return hits
 
-    words = re.findall(r"\b\w+\b", text.lower())
+    goto, fail, out = PHRASE_MATCHER
+    neg_ends = []
+    node = 0
+
+    def negated(start):
+        for j in reversed(neg_ends):
+            if j < start - NEGATION_WINDOW:
+                return False
+            if j < start:
+                return True
+        return False
+
+    matches = []    # (start, -length, categories)
+    for i, tok in enumerate(TOKEN_RE.findall(text.lower())):
+        while node and tok not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(tok, 0)
+
+        negates_here = False
+        for length, cats, negates in out[node]:
+            negates_here = negates_here or negates
+            if cats:
+                matches.append((i - length + 1, -length, cats))
+
+        if negates_here:
+            neg_ends.append(i)
+
+    free = {}   # category -> first token past the last match taken for it
+    for start, neg_length, cats in sorted(matches):
+        taken = [c for c in cats if start >= free.get(c, 0)]
+        if not taken:
+            continue
+        counts = not negated(start)
+        for c in taken:
+            free[c] = start - neg_length
+            if counts:
+                hits[c] += 1
 
-    def neg(i):
-        return any(w in NEGATORS for w in words[max(0,i-3):i])
+    return hits
 
-    for i,w in enumerate(words):
-        if neg(i): continue
-        if w in ENGAGING: hits["engaging"] += 1
-        if w in CURIOUS: hits["curious"] += 1
-        if w in HUMOR: hits["humorous"] += 1
-        if w in SUPPORT: hits["supportive"] += 1
-        if w in DOMINANT: hits["dominant"] += 1
-        if w in COMBATIVE: hits["combative"] += 1
-        if w in FLIRTY: hits["flirty"] += 1
-        if w in SEXUAL: hits["sexual"] += 1
-        if w in CURSE: hits["curse"] += 1
+# =================================================
+# HIT CACHE (CONTENT-ADDRESSED, LRU)
+# =================================================
+# The same context_sample shows up on many rows and every rebuild. Scores are
+# cached by a digest of the normalized text so each distinct message is
+# tokenized once per process.
 
-    return hits
+HIT_KEYS = tuple(TRAIT_WEIGHTS) + tuple(STYLE_WEIGHTS)
+HITS_CACHE_SIZE = int(os.environ.get("HITS_CACHE_SIZE", 50000))
+HITS_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+_HITS_CACHE = OrderedDict()
+_HITS_LOCK = threading.Lock()
+_NO_HITS = (0,) * len(HIT_KEYS)
+
+
+def hit_vector(text):
+    """extract_hits() as a tuple in HIT_KEYS order, memoized by content."""
+    if not text:
+        return _NO_HITS
+
+    norm = " ".join(str(text).lower().split())
+    key = hashlib.blake2b(norm.encode(), digest_size=16).digest()
+
+    with _HITS_LOCK:
+        vec = _HITS_CACHE.get(key)
+        if vec is not None:
+            _HITS_CACHE.move_to_end(key)
+            HITS_STATS["hits"] += 1
+            return vec
+
+    hits = timed("extract", extract_hits, norm)
+    vec = tuple(hits.get(k, 0) for k in HIT_KEYS)
+
+    with _HITS_LOCK:
+        HITS_STATS["misses"] += 1
+        _HITS_CACHE[key] = vec
+        if len(_HITS_CACHE) > HITS_CACHE_SIZE:
+            _HITS_CACHE.popitem(last=False)
+            HITS_STATS["evictions"] += 1
+
+    return vec
 
 # =================================================
 # DATA FETCH
 # =================================================
+# The feed is a gviz reply: setResponse({..., "table": {"cols": [...],
+# "rows": [{"c": [...]}, ...]}}). GvizRowParser is pushed text as it arrives
+# and decodes one row object at a time, so only the current chunk and the
+# row being assembled are ever held, however long the sheet gets.
+#
+# Requests go through one keep-alive session per process. Transient failures
+# are retried with jittered backoff, but only until the first row has been
+# handed to the aggregator; after that a failure aborts the whole refresh.
+# Repeated failed refreshes open a circuit breaker, and while it is open no
+# request is made at all (the last good snapshot keeps serving).
+
+FEED_CHUNK = 64 * 1024
+FEED_TIMEOUT = (
+    float(os.environ.get("FEED_CONNECT_TIMEOUT", 5)),
+    float(os.environ.get("FEED_READ_TIMEOUT", 20)),
+)
+FEED_RETRIES = int(os.environ.get("FEED_RETRIES", 3))           # extra attempts per refresh
+FEED_BACKOFF = float(os.environ.get("FEED_BACKOFF", 0.5))       # base delay, doubled per attempt
+FEED_BREAKER_FAILURES = int(os.environ.get("FEED_BREAKER_FAILURES", 3))
+FEED_BREAKER_COOLDOWN = int(os.environ.get("FEED_BREAKER_COOLDOWN", 60))
+FEED_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class FeedError(Exception):
+    """The feed could not be fetched, or did not hold a usable gviz table."""
+
+    def __init__(self, message, transient=True, status=None):
+        super().__init__(message)
+        self.transient = transient
+        self.status = status    # HTTP status, when the feed answered with one
+
+# per process; only the process that refreshes (see is_leader) fills these in
+FEED_STATS = {
+    "fetches": 0,
+    "failures": 0,
+    "retries": 0,
+    "breaker_rejections": 0,
+    "consecutive_failures": 0,
+    "breaker_open_until": 0.0,
+    "last_error": None,     # exception type (and HTTP status) only: /metrics/feed is public
+    "last_success": None,
+    "last": None,    # phase timings of the last successful fetch
+}
+_FEED_SESSION = {"pid": None, "session": None}
+
+_JSON = json.JSONDecoder()
+_WS = " \t\r\n"
+
+class GvizRowParser:
+    """Push parser for a gviz response: feed() text, get back finished rows."""
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.cols = None
+        self.state = "start"     # start -> cols -> rows -> row <-> sep -> done
+
+    def feed(self, text):
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += text
+        rows = []
+        while self.state != "done" and self._step(rows):
+            pass
+        return rows
+
+    def close(self):
+        if self.state != "done":
+            raise FeedError(f"gviz feed ended early (parser state: {self.state})")
+
+    def _skip_ws(self, i):
+        buf = self.buf
+        while i < len(buf) and buf[i] in _WS:
+            i += 1
+        return i
+
+    def _find(self, marker):
+        """Index just past marker, or None (keeping a possible partial match)."""
+        i = self.buf.find(marker, self.pos)
+        if i < 0:
+            self.pos = max(self.pos, len(self.buf) - len(marker) + 1)
+            return None
+        self.pos = i
+        return i + len(marker)
+
+    def _member(self, key, opener):
+        """Index of the value after `"key":`, provided it starts with opener."""
+        i = self._find(f'"{key}"')
+        if i is None:
+            return None
+        buf = self.buf
+        i = self._skip_ws(i)
+        if i < len(buf):
+            if buf[i] != ":":
+                raise FeedError(f"gviz feed: expected ':' after {key!r}")
+            i = self._skip_ws(i + 1)
+        if i >= len(buf):
+            return None
+        if buf[i] != opener:
+            raise FeedError(f"gviz feed: expected {opener!r} for {key!r}")
+        return i
+
+    def _step(self, rows):
+        buf = self.buf
+
+        if self.state == "start":
+            i = self._find("setResponse(")
+            if i is None:
+                return False
+            self.pos, self.state = i, "cols"
+            return True
+
+        if self.state == "cols":
+            i = self._member("cols", "[")
+            if i is None:
+                return False
+            try:
+                cols, end = _JSON.raw_decode(buf, i)
+            except json.JSONDecodeError:
+                return False
+            self.cols = [c["label"] for c in cols]
+            self.pos, self.state = end, "rows"
+            return True
+
+        if self.state == "rows":
+            i = self._member("rows", "[")
+            if i is None:
+                return False
+            self.pos, self.state = i + 1, "row"
+            return True
+
+        i = self._skip_ws(self.pos)
+        if i >= len(buf):
+            return False
+
+        if self.state == "sep":
+            if buf[i] not in ",]":
+                raise FeedError(f"gviz feed: unexpected {buf[i]!r} between rows")
+            self.pos, self.state = i + 1, ("row" if buf[i] == "," else "done")
+            return True
+
+        # state == "row"
+        if buf[i] == "]":
+            self.pos, self.state = i + 1, "done"
+            return True
+        try:
+            row, end = _JSON.raw_decode(buf, i)
+        except json.JSONDecodeError:
+            return False     # row not complete yet
+        cols = self.cols
+        rows.append({cols[j]: cell["v"] if cell else 0 for j, cell in enumerate(row["c"])})
+        self.pos, self.state = end, "sep"
+        return True
+
+
+def feed_session():
+    # a forked worker must not share its parent's pooled sockets
+    if _FEED_SESSION["pid"] != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _FEED_SESSION.update(pid=os.getpid(), session=session)
+    return _FEED_SESSION["session"]
+
+
+def _stream_feed(timing):
+    """One attempt: yield rows while adding to connect/transfer/parse timings."""
+    clock = time.perf_counter
+    t = clock()
+    with feed_session().get(GOOGLE_PROFILES_FEED, timeout=FEED_TIMEOUT, stream=True) as r:
+        timing["connect"] += clock() - t    # up to the response headers
+        if r.status_code != 200:
+            raise FeedError(
+                f"feed answered HTTP {r.status_code}",
+                transient=r.status_code in FEED_RETRY_STATUSES, status=r.status_code,
+            )
+
+        parser = GvizRowParser()
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        chunks = r.iter_content(FEED_CHUNK)
+        while True:
+            t = clock()
+            chunk = next(chunks, None)
+            timing["transfer"] += clock() - t
+            if chunk is None:
+                break
+            timing["bytes"] += len(chunk)
+
+            t = clock()
+            try:
+                rows = parser.feed(decoder.decode(chunk))
+            except (KeyError, IndexError, TypeError) as e:
+                raise FeedError(f"gviz feed: malformed table ({e!r})") from e
+            timing["parse"] += clock() - t
+            timing["rows"] += len(rows)
+            yield from rows
+
+    rows = parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    timing["rows"] += len(rows)
+    yield from rows
 
-def fetch_rows():
-    r = requests.get(GOOGLE_PROFILES_FEED, timeout=20)
-    m = re.search(r"setResponse\((\{.*\})\)", r.text, re.S)
-    payload = json.loads(m.group(1))
 
-    cols = [c["label"] for c in payload["table"]["cols"]]
-    rows = []
+def fetch_rows():
+    """Stream the feed, yielding one {column label: value} dict per sheet row."""
+    wait = FEED_STATS["breaker_open_until"] - time.time()
+    if wait > 0:
+        FEED_STATS["breaker_rejections"] += 1
+        raise FeedError(f"feed circuit open, next attempt in {wait:.0f}s", transient=False)
+
+    FEED_STATS["fetches"] += 1
+    started = time.perf_counter()
+    try:
+        for attempt in range(FEED_RETRIES + 1):
+            if attempt:
+                FEED_STATS["retries"] += 1
+                time.sleep(random.uniform(0, FEED_BACKOFF * 2 ** (attempt - 1)))
+
+            timing = {"connect": 0.0, "transfer": 0.0, "parse": 0.0, "rows": 0, "bytes": 0}
+            try:
+                for row in _stream_feed(timing):
+                    yield row
+                break
+            except (requests.RequestException, FeedError) as e:
+                transient = getattr(e, "transient", True)
+                if timing["rows"] or not transient or attempt == FEED_RETRIES:
+                    raise
+                app.logger.warning("feed attempt %d failed: %s", attempt + 1, e)
+    except Exception as e:
+        FEED_STATS["failures"] += 1
+        FEED_STATS["consecutive_failures"] += 1
+        # the message can carry the feed URL; the refresher logs it in full
+        status = getattr(e, "status", None)
+        FEED_STATS["last_error"] = type(e).__name__ + (f" (HTTP {status})" if status else "")
+        if FEED_STATS["consecutive_failures"] >= FEED_BREAKER_FAILURES:
+            FEED_STATS["breaker_open_until"] = time.time() + FEED_BREAKER_COOLDOWN
+        raise
+
+    timing["total"] = time.perf_counter() - started
+    FEED_STATS.update(
+        consecutive_failures=0, breaker_open_until=0.0, last_success=time.time(), last=timing
+    )
 
-    for row in payload["table"]["rows"]:
-        rec = {}
-        for i, cell in enumerate(row["c"]):
-            rec[cols[i]] = cell["v"] if cell else 0
-        rows.append(rec)
 
-    return rows
+def feed_stats():
+    stats = dict(FEED_STATS)
+    stats["breaker"] = "open" if stats["breaker_open_until"] > time.time() else "closed"
+    stats["enabled"] = bool(GOOGLE_PROFILES_FEED)
+    stats["ingest"] = dict(INGEST_STATS, buffered=len(_INGEST))
+    return stats
 
 # =================================================
 # SUMMARY ENGINE (UNCHANGED)
@@ -271,223 +734,1584 @@ def build_summary(conf, traits, styles):
     return base
 
 # =================================================
-# BUILD PROFILES (FULL, RESTORED, LEADERBOARD-SAFE)
+# ACTIVITY WINDOWS (PLATFORM METRICS)
 # =================================================
+# Per activity kind, each avatar sits in the minute bucket of its latest
+# activity of that kind, and each bucket keeps only a count. Distinct avatars
+# active in a window are then the sum of the buckets it covers: exact, O(buckets)
+# to answer, and one entry per avatar to maintain. The aggregator moves avatars
+# between buckets as their rows come and go, and pushed rows move their avatar
+# forward the moment /ingest accepts them, before anything scores them.
+#
+# The leader publishes the buckets for the last ACTIVITY_SPAN every
+# ACTIVITY_PUBLISH seconds, on their own timer and in their own file, rather
+# than inside profile snapshots. Requests slide the windows to their own
+# clock, so "live now" tracks pushed activity whatever the scoring is doing.
+
+ACTIVITY_BUCKET = 60        # s per bucket; windows are exact to the bucket
+ACTIVITY_KINDS = ("spoke", "silent", "power")
+PLATFORM_WINDOWS = {
+    # metric -> (activity kind, window in s)
+    "spoke_24h": ("spoke", 86400),
+    "live_now": ("spoke", 120),
+    "power_users": ("power", 3600),
+    "silent_observers": ("silent", 300),
+}
+ACTIVITY_SPAN = max(window for _, window in PLATFORM_WINDOWS.values())
+
+
+def activity_bucket(ts):
+    return int(ts // ACTIVITY_BUCKET)
+
+
+class ActivityWindow:
+    """Avatars counted by the bucket of their latest activity of one kind."""
+
+    __slots__ = ("latest", "counts", "buckets")
+
+    def __init__(self):
+        self.latest = {}    # uid -> bucket
+        self.counts = {}    # bucket -> avatars whose latest activity falls in it
+        self.buckets = []   # sorted non-empty buckets
+
+    def move(self, uid, ts):
+        """Record uid's latest activity at ts (None: no activity of this kind)."""
+        new = None if ts is None else activity_bucket(ts)
+        old = self.latest.get(uid)
+        if new == old:
+            return
+        if old is not None:
+            n = self.counts[old] - 1
+            if n:
+                self.counts[old] = n
+            else:
+                del self.counts[old]
+                del self.buckets[bisect.bisect_left(self.buckets, old)]
+            del self.latest[uid]
+        if new is not None:
+            self._enter(uid, new)
+
+    def advance(self, uid, ts):
+        """Move uid forward to ts, never back."""
+        old = self.latest.get(uid)
+        if old is None or activity_bucket(ts) > old:
+            self.move(uid, ts)
+
+    def _enter(self, uid, b):
+        self.latest[uid] = b
+        if b in self.counts:
+            self.counts[b] += 1
+        else:
+            self.counts[b] = 1
+            bisect.insort(self.buckets, b)
+
+    def since(self, b):
+        """{bucket: avatars} for every bucket from b on."""
+        counts = self.counts
+        return {k: counts[k] for k in self.buckets[bisect.bisect_left(self.buckets, b):]}
+
+
+def window_counts(activity, now):
+    """Platform metrics from exported activity buckets, windows ending at now."""
+    out = {"total_registered": activity["registered"]}
+    for metric, (kind, window) in PLATFORM_WINDOWS.items():
+        first = activity_bucket(now - window)
+        out[metric] = sum(n for b, n in activity["buckets"][kind].items() if b >= first)
+    return out
 
-def build_profiles():
-    if CACHE["profiles"] and time.time() - CACHE["ts"] < CACHE_TTL:
-        return CACHE["profiles"]
+# =================================================
+# INCREMENTAL AGGREGATION
+# =================================================
+# Rows are keyed by (avatar_uuid, timestamp, occurrence) and remembered with a
+# digest of their content, so a refresh only scores rows that are new or were
+# edited and only re-derives avatars whose inputs moved.
+#
+# Exponential decay: each avatar keeps its weighted sums as of a reference
+# time "ref". Moving them to now is one multiply, and a row is added or
+# retracted with its weight at ref, so neither needs the avatar's other rows.
+# Weights drift continuously, so a profile is re-derived once it is
+# DECAY_STALE old even if none of its rows changed.
+#
+# Step decay: sums are integer hit counts split by decay bucket; a heap of
+# bucket edges moves rows to their next weight as they age. With exponential
+# decay the same heap takes rows out of the integer last-hour "recent" count.
+#
+# Pushed rows use the same keys. They are exempt from the feed diff until the
+# feed lists them (then the feed owns them) or they outlive INGEST_RETENTION.
+
+AGG = {
+    "rows": {},         # row key -> RowRecord
+    "registered": {},   # uid -> row count, including rows that failed to parse
+    "avatars": {},      # uid -> Accumulator
+    "edges": [],        # heap of (deadline, seq, row key)
+    "seq": 0,
+    "dirty": {},        # uids whose profile must be re-derived (ordered set)
+    "profiles": {},     # uid -> derived Profile
+    "pushed": OrderedDict(),  # row key -> arrival time, pushed rows the feed hasn't listed
+    "derived": OrderedDict(), # uid -> when its profile was derived (exponential decay)
+    "activity": {kind: ActivityWindow() for kind in ACTIVITY_KINDS},
+}
 
-    rows = fetch_rows()
-    profiles = {}
 
-    now = time.time()
+class RowRecord:
+    """One row as it was scored. counts is None if the row didn't parse."""
+
+    __slots__ = ("digest", "uid", "ts", "msgs", "bucket", "counts")
+
+    def __init__(self, digest, uid, ts=None, msgs=0, bucket=0, counts=None):
+        self.digest = digest
+        self.uid = uid
+        self.ts = ts
+        self.msgs = msgs
+        self.bucket = bucket
+        self.counts = counts
+
+    def __reduce__(self):
+        return RowRecord, (self.digest, self.uid, self.ts, self.msgs, self.bucket, self.counts)
 
-    total_registered_set = set()
-    spoke_24h_set = set()
-    live_now_set = set()
-    power_users_set = set()
-    silent_set = set()
 
+class Accumulator:
+    """
+    One avatar's running sums: per-bucket integer counts in `sums` (step
+    decay), or `decayed` as of `ref` plus `recent`, the messages of rows
+    still in their first hour (exponential decay).
+    """
+
+    __slots__ = (
+        "avatar_uuid", "name", "keys", "last_spoke", "last_silent", "last_power",
+        "sums", "decayed", "recent", "ref",
+    )
+
+    def __init__(self, avatar_uuid, name, width, now):
+        self.avatar_uuid = avatar_uuid
+        self.name = name
+        self.keys = set()   # row keys
+        self.last_spoke = self.last_silent = self.last_power = None
+        if STEP_DECAY:
+            self.sums = [[0] * width for _ in DECAY_WEIGHTS]
+            self.decayed = self.recent = self.ref = None
+        else:
+            self.sums = None
+            self.decayed = array("d", bytes(8 * width))
+            self.recent = 0
+            self.ref = now
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+
+_COUNT_VECTORS = {}         # interned per-row count tuples; most rows share a few
+COUNT_VECTORS_MAX = 65536
+
+def intern_counts(counts):
+    shared = _COUNT_VECTORS.get(counts)
+    if shared is None:
+        if len(_COUNT_VECTORS) >= COUNT_VECTORS_MAX:
+            return counts
+        shared = _COUNT_VECTORS[counts] = counts
+    return shared
+
+
+def _cell_text(v):
+    # the feed sends empty cells as 0; a pushed row has "" there
+    if isinstance(v, str):
+        return v.strip()
+    return v if v else ""
+
+
+def row_digest(r):
+    # canonical, so the feed's copy of a row (messages 5.0) and the pushed
+    # copy (messages 5) hash alike and the push is recognised as the same row
+    msgs = r.get("messages")
+    if isinstance(msgs, float) and msgs.is_integer():
+        msgs = int(msgs)
+    return hashlib.blake2b(
+        repr((_cell_text(r.get("display_name")), msgs, _cell_text(r.get("context_sample")))).encode(),
+        digest_size=12
+    ).digest()
+
+
+def _push_edge(key, ts, bucket):
+    if bucket < len(ROW_EDGES):
+        AGG["seq"] += 1
+        heapq.heappush(AGG["edges"], (ts + ROW_EDGES[bucket], AGG["seq"], key))
+
+
+def _decay_to(a, now):
+    """Bring an avatar's exponentially decayed sums forward to now."""
+    dt = now - a.ref
+    if dt > 0:
+        f = 2.0 ** (-dt / DECAY_HALF_LIFE)
+        decayed = a.decayed
+        for i in range(len(decayed)):
+            decayed[i] *= f
+        a.ref = now
+
+
+def _add_decayed(a, ts, counts, sign):
+    # weight as of a.ref, which is never earlier than ts
+    age = a.ref - ts
+    w = sign * 2.0 ** (-age / DECAY_HALF_LIFE)
+    decayed = a.decayed
+    for i, c in enumerate(counts):
+        decayed[i] += c * w
+
+
+_STALE_EXTREMES = set()    # uids that lost a row holding one of their last_* times
+
+def _avatar_extremes(a):
+    # newest timestamp per activity class, for the platform metric windows
+    a.last_spoke = a.last_silent = a.last_power = None
+    rows = AGG["rows"]
+    for key in a.keys:
+        rec = rows[key]
+        ts, msgs = rec.ts, rec.msgs
+        if msgs > 0 and (a.last_spoke is None or ts > a.last_spoke):
+            a.last_spoke = ts
+        if msgs == 0 and (a.last_silent is None or ts > a.last_silent):
+            a.last_silent = ts
+        if msgs >= 20 and (a.last_power is None or ts > a.last_power):
+            a.last_power = ts
+    _track_activity(a.avatar_uuid, a)
+
+
+_ACTIVITY_LOCK = threading.Lock()   # windows also move on /ingest request threads
+_NOTED = {}    # uid -> latest (spoke, silent, power) of pushed rows still buffered
+
+def _track_activity(uid, a=None):
+    # a is None once the avatar has no rows left
+    latest = (a.last_spoke, a.last_silent, a.last_power) if a is not None else (None,) * 3
+    with _ACTIVITY_LOCK:
+        noted = _NOTED.get(uid)
+        if noted:
+            # buffered pushed rows aren't in a yet; don't move back past them
+            latest = [n if t is None or (n is not None and n > t) else t for t, n in zip(latest, noted)]
+        windows = AGG["activity"]
+        for kind, ts in zip(ACTIVITY_KINDS, latest):
+            windows[kind].move(uid, ts)
+        _STATE["activity_moved"] = True
+
+
+def _note_pushed(rows, now):
+    # caller holds _ACTIVITY_LOCK; same activity classes as _avatar_extremes()
+    windows = AGG["activity"]
     for r in rows:
-        uid = r.get("avatar_uuid")
-        if not uid:
+        uid, ts, msgs = r["avatar_uuid"], r["timestamp"], r["messages"]
+        if not STEP_DECAY:
+            ts = min(ts, now)   # as score_row() will
+        noted = _NOTED.setdefault(uid, [None, None, None])
+        for i, hit in enumerate((msgs > 0, msgs == 0, msgs >= 20)):
+            if hit and (noted[i] is None or ts > noted[i]):
+                noted[i] = ts
+                windows[ACTIVITY_KINDS[i]].advance(uid, ts)
+    _STATE["activity_moved"] = True
+
+
+def score_row(r, now):
+    """(ts, msgs, bucket, counts) for a row, or None if it doesn't parse."""
+    try:
+        ts = float(r.get("timestamp", now))
+        msgs = int(r.get("messages", 0))
+    except:
+        return None
+
+    counts = (max(int(r.get("messages", 1)), 1),) + hit_vector(r.get("context_sample", ""))
+    if not STEP_DECAY:
+        ts = min(ts, now)   # a row stamped in the future counts from now
+    return ts, msgs, row_bucket(now - ts), counts
+
+
+def _apply_row(key, digest, r, now):
+    _apply_scored(key, digest, r, score_row(r, now), now)
+
+
+def _apply_scored(key, digest, r, scored, now):
+    uid = key[0]
+    AGG["registered"][uid] = AGG["registered"].get(uid, 0) + 1
+
+    if scored is None:
+        AGG["rows"][key] = RowRecord(digest, uid)
+        return
+
+    ts, msgs, bucket, counts = scored
+    counts = intern_counts(counts)
+
+    a = AGG["avatars"].get(uid)
+    if a is None:
+        name = r.get("display_name", "Unknown")
+        a = AGG["avatars"][uid] = Accumulator(
+            uid, sys.intern(name) if type(name) is str else name, len(counts), now
+        )
+
+    a.keys.add(key)
+    if STEP_DECAY:
+        sums = a.sums[bucket]
+        for i, c in enumerate(counts):
+            sums[i] += c
+    else:
+        _decay_to(a, now)
+        _add_decayed(a, ts, counts, 1)
+        if bucket == 0:
+            a.recent += counts[0]
+
+    if msgs > 0 and (a.last_spoke is None or ts > a.last_spoke):
+        a.last_spoke = ts
+    if msgs == 0 and (a.last_silent is None or ts > a.last_silent):
+        a.last_silent = ts
+    if msgs >= 20 and (a.last_power is None or ts > a.last_power):
+        a.last_power = ts
+    _track_activity(uid, a)
+
+    AGG["rows"][key] = RowRecord(digest, uid, ts, msgs, bucket, counts)
+    AGG["dirty"][uid] = None
+    _push_edge(key, ts, bucket)
+
+
+def _retract_row(key):
+    rec = AGG["rows"].pop(key)
+    uid = rec.uid
+
+    AGG["registered"][uid] -= 1
+    if not AGG["registered"][uid]:
+        del AGG["registered"][uid]
+
+    if rec.counts is None:
+        return
+
+    a = AGG["avatars"][uid]
+    a.keys.discard(key)
+    if STEP_DECAY:
+        sums = a.sums[rec.bucket]
+        for i, c in enumerate(rec.counts):
+            sums[i] -= c
+    else:
+        _add_decayed(a, rec.ts, rec.counts, -1)
+        if rec.bucket == 0:
+            a.recent -= rec.counts[0]
+
+    if not a.keys:
+        del AGG["avatars"][uid]
+        _track_activity(uid)
+        _STALE_EXTREMES.discard(uid)
+    elif rec.ts in (a.last_spoke, a.last_silent, a.last_power):
+        # rescanned once at the end of the pass, however many rows go
+        _STALE_EXTREMES.add(uid)
+    AGG["dirty"][uid] = None
+
+
+def _advance_buckets(now):
+    edges = AGG["edges"]
+    while edges and edges[0][0] < now:
+        _, _, key = heapq.heappop(edges)
+        rec = AGG["rows"].get(key)
+        if rec is None or rec.counts is None:
+            continue  # row was removed or re-applied since this edge was queued
+
+        bucket = row_bucket(now - rec.ts)
+        if bucket == rec.bucket:
             continue
 
-        total_registered_set.add(uid)
+        a = AGG["avatars"][rec.uid]
+        if STEP_DECAY:
+            for i, c in enumerate(rec.counts):
+                a.sums[rec.bucket][i] -= c
+                a.sums[bucket][i] += c
+        elif rec.bucket == 0:
+            a.recent -= rec.counts[0]   # out of the recent hour
+        rec.bucket = bucket
+        _push_edge(key, rec.ts, bucket)
+        AGG["dirty"][rec.uid] = None
+
+
+def _expire_derived(now):
+    # exponential decay: profiles derived DECAY_STALE ago are due again
+    derived = AGG["derived"]
+    cutoff = now - DECAY_STALE
+    while derived:
+        uid = next(iter(derived))
+        if derived[uid] > cutoff:
+            break
+        del derived[uid]
+        if uid in AGG["avatars"]:
+            AGG["dirty"][uid] = None
+
+
+def _fold_pushed(rows, now):
+    for r in rows:
+        uid = sys.intern(r["avatar_uuid"])
+        digest = row_digest(r)
+
+        # same (uid, timestamp) with other content is the next occurrence;
+        # identical content is a resent batch or a row the feed already has
+        occ = 0
+        key = (uid, r["timestamp"], occ)
+        while key in AGG["rows"]:
+            if AGG["rows"][key].digest == digest:
+                break
+            occ += 1
+            key = (uid, r["timestamp"], occ)
+        else:
+            _apply_row(key, digest, r, now)
+            AGG["pushed"][key] = now
+
+
+def _expire_pushed(now):
+    pushed = AGG["pushed"]
+    cutoff = now - INGEST_RETENTION
+    while pushed:
+        key = next(iter(pushed))
+        if pushed[key] >= cutoff:
+            break
+        del pushed[key]
+        if key in AGG["rows"]:
+            _retract_row(key)
+
+
+def aggregate_rows(rows, now, pushed=()):
+    """
+    Fold pushed rows, then a full feed pass (unless rows is None), into AGG,
+    touching only rows that changed.
+    """
+    _fold_pushed(pushed, now)
+
+    if rows is not None:
+        seen = set()
+        occurrences = defaultdict(int)
+        executor = scoring_pool()
+        pool = ParallelPass(executor, now) if executor is not None else None
 
         try:
-            ts = float(r.get("timestamp", now))
-            msgs = int(r.get("messages", 0))
-        except:
-            continue
+            for r in rows:
+                uid = r.get("avatar_uuid")
+                if not uid:
+                    continue
+                if type(uid) is str:
+                    uid = sys.intern(uid)   # one copy per avatar instead of one per row key
+
+                ident = (uid, r.get("timestamp"))
+                key = ident + (occurrences[ident],)
+                occurrences[ident] += 1
+                seen.add(key)
+                AGG["pushed"].pop(key, None)
+
+                if pool is not None and len(seen) > PARALLEL_MIN_ROWS:
+                    pool.add(key, r)
+                    continue
+
+                digest = row_digest(r)
+                rec = AGG["rows"].get(key)
+                if rec is not None:
+                    if rec.digest == digest:
+                        continue
+                    _retract_row(key)
+                _apply_row(key, digest, r, now)
+        finally:
+            # rows already read are folded in even if the stream broke off
+            if pool is not None:
+                pool.finish()
+
+        for key in AGG["rows"].keys() - seen - AGG["pushed"].keys():
+            _retract_row(key)
+
+    _expire_pushed(now)
+    for uid in _STALE_EXTREMES:
+        _avatar_extremes(AGG["avatars"][uid])
+    _STALE_EXTREMES.clear()
+    _advance_buckets(now)
+    if not STEP_DECAY:
+        _expire_derived(now)
+
+    dirty = [AGG["avatars"].get(uid) for uid in AGG["dirty"]]
+    if not STEP_DECAY:
+        for a in dirty:
+            if a is not None:
+                _decay_to(a, now)
+    if np is not None and len(dirty) >= NP_MIN_BATCH:
+        derived = derive_profiles_np([a for a in dirty if a is not None])
+    else:
+        derived = (derive_profile(a) for a in dirty if a is not None)
+
+    for uid in AGG["dirty"]:
+        AGG["derived"].pop(uid, None)
+        if uid not in AGG["avatars"]:
+            AGG["profiles"].pop(uid, None)
+        elif not STEP_DECAY:
+            AGG["derived"][uid] = now
+    for p in derived:
+        AGG["profiles"][p["avatar_uuid"]] = p
+    AGG["dirty"].clear()
+
+
+def export_activity(now):
+    """The activity buckets a request needs to answer every platform window."""
+    first = activity_bucket(now - ACTIVITY_SPAN)
+    with _ACTIVITY_LOCK:
+        return {
+            "schema": SNAPSHOT_SCHEMA,
+            "registered": len(AGG["registered"]),
+            "buckets": {kind: w.since(first) for kind, w in AGG["activity"].items()},
+            "ts": now,
+            "version": time.time_ns(),
+        }
+
+# =================================================
+# PARALLEL SCORING (PROCESS POOL)
+# =================================================
+# On a large feed pass, rows past the first PARALLEL_MIN_ROWS are sent in
+# chunks to a pool of forked processes. Each worker digests its rows, skips
+# the ones whose digest matches what AGG already holds, and scores the rest
+# (parse, decay bucket, hit counts). The parent folds the results in feed
+# order while later chunks are still being scored, so AGG ends up exactly as
+# the serial loop would leave it, however many workers there are. Small feeds
+# and push-only refreshes never touch the pool.
+#
+# The pool is off by default: each worker is a full copy of the process, so
+# set SCORING_PROCESSES to the cores the host can actually spare. Only the
+# leader scores, so only the process that wins is_leader() at import forks
+# a pool, and it does so before warm_start() starts any thread: no child
+# inherits a lock another thread was holding. Workers get the lexicon
+# automaton for free and never touch AGG. A worker promoted to leader later,
+# one forked after import (gunicorn --preload), or one whose pool broke
+# scores serially rather than fork from under its threads.
+
+SCORING_PROCESSES = int(os.environ.get("SCORING_PROCESSES", 1))
+PARALLEL_MIN_ROWS = int(os.environ.get("PARALLEL_MIN_ROWS", 20000))
+PARALLEL_CHUNK = 2000   # rows per task
+
+_POOL = {"executor": None, "pid": None}
+
+
+def start_scoring_pool():
+    """Fork the scoring workers now, while this process has no other threads."""
+    if SCORING_PROCESSES <= 1 or not hasattr(os, "fork"):
+        return
+    if threading.active_count() > 1:
+        app.logger.warning("threads already running, scoring serially instead of forking a pool")
+        return
+    if not is_leader():
+        return
+    executor = ProcessPoolExecutor(
+        SCORING_PROCESSES, mp_context=multiprocessing.get_context("fork"),
+        initializer=_pool_worker_init
+    )
+    executor.submit(int).result()   # with fork, the first task starts every worker
+    _POOL.update(executor=executor, pid=os.getpid())
 
-        age = now - ts
 
-        # Spoke in last 24 hours
-        if age <= 86400 and msgs > 0:
-            spoke_24h_set.add(uid)
+def _pool_worker_init():
+    # don't keep the leader lock alive if this worker outlives its parent
+    if _SHARED["lock_fd"] is not None:
+        os.close(_SHARED["lock_fd"])
+        _SHARED["lock_fd"] = None
 
-        # Live right now (real chat activity)
-        if age <= 120 and msgs > 0:
-            live_now_set.add(uid)
 
-        # Silent observer (HUD ping but no speech)
-        if age <= 300 and msgs == 0:
-            silent_set.add(uid)
+def scoring_pool():
+    """This process's worker pool, or None to score serially."""
+    return _POOL["executor"] if _POOL["pid"] == os.getpid() else None
 
-        # Power users (20+ msgs in last hour)
-        if age <= 3600 and msgs >= 20:
-            power_users_set.add(uid)
 
-        w = decay(ts)
+def score_chunk(rows, known, now):
+    """
+    Pool task: for each row, None if its digest equals the one in known,
+    else (digest, score_row() result).
+    """
+    out = []
+    for r, old in zip(rows, known):
+        digest = row_digest(r)
+        out.append(None if digest == old else (digest, score_row(r, now)))
+    return out
 
-        p = profiles.setdefault(uid, {
-            "avatar_uuid": uid,
-            "name": r.get("display_name", "Unknown"),
-            "messages": 0,
-            "raw_traits": defaultdict(float),
-            "raw_styles": defaultdict(float),
-            "recent": 0
-        })
 
-        msgs = max(int(r.get("messages", 1)), 1)
-        p["messages"] += msgs * w
+class ParallelPass:
+    """Feeds one aggregate_rows() pass through the pool, folding results in order."""
+
+    def __init__(self, executor, now):
+        self.executor = executor
+        self.now = now
+        self.batch = []
+        self.pending = deque()
+
+    def add(self, key, r):
+        self.batch.append((key, r))
+        if len(self.batch) >= PARALLEL_CHUNK:
+            self._submit()
+            # bounded read-ahead keeps memory flat on huge feeds
+            while len(self.pending) > 2 * SCORING_PROCESSES:
+                self._fold(*self.pending.popleft())
+
+    def finish(self):
+        if self.batch:
+            self._submit()
+        while self.pending:
+            self._fold(*self.pending.popleft())
+
+    def _submit(self):
+        batch, self.batch = self.batch, []
+        rows = [r for _, r in batch]
+        known = [getattr(AGG["rows"].get(key), "digest", None) for key, _ in batch]
+        try:
+            future = self.executor.submit(score_chunk, rows, known, self.now)
+        except BrokenProcessPool:
+            self._abandon()
+            raise
+        self.pending.append((batch, future))
 
-        if age < 3600:
-            p["recent"] += msgs
+    def _fold(self, batch, future):
+        try:
+            results = future.result()
+        except BrokenProcessPool:
+            self._abandon()
+            raise
+        for (key, r), result in zip(batch, results):
+            if result is None:
+                continue
+            digest, scored = result
+            if key in AGG["rows"]:
+                _retract_row(key)
+            _apply_scored(key, digest, r, scored, self.now)
+
+    def _abandon(self):
+        # a worker died; forking a new pool now would copy our threads' locks
+        app.logger.error("scoring pool broke, scoring serially from now on")
+        _POOL.update(executor=None, pid=None)
+        self.batch, self.pending = [], deque()
 
-        hits = extract_hits(r.get("context_sample", ""))
+# =================================================
+# BUILD PROFILES (FULL, RESTORED, LEADERBOARD-SAFE)
+# =================================================
+# Profiles live in every worker's snapshot, so they are slotted records
+# rather than dicts: a dozen small numbers, a few shared strings, and the
+# trait/style percentages as tuples. They still read like the dicts they
+# replaced (p["traits"]["curious"], p.get(...), dict(p)); as_dict() builds
+# the plain JSON view where a response needs one.
 
-        for k, v in hits.items():
-            if k in TRAIT_WEIGHTS:
-                p["raw_traits"][k] += v * TRAIT_WEIGHTS[k] * w
-            if k in STYLE_WEIGHTS:
-                p["raw_styles"][k] += v * STYLE_WEIGHTS[k] * w
+class Scores(Mapping):
+    """Read-only trait or style percentages in a fixed key order."""
 
-    out = []
+    __slots__ = ("_scores",)
+    KEYS = ()
+    INDEX = {}
 
-    for p in profiles.values():
-        m = max(p["messages"], 1)
+    def __init__(self, scores):
+        self._scores = tuple(scores)
 
-        confidence = min(1.0, math.log(m + 1) / 4)
-        damp = max(0.05, confidence ** 1.5)
+    def __getitem__(self, key):
+        return self._scores[self.INDEX[key]]
 
-        traits = {
-            k: min((p["raw_traits"][k] / m) * damp, 1.0)
-            for k in TRAIT_WEIGHTS
-        }
+    def __iter__(self):
+        return iter(self.KEYS)
 
-        styles = {
-            k: min((p["raw_styles"][k] / (m * 0.3)) * damp, 1.0)
-            for k in STYLE_WEIGHTS
-        }
+    def __len__(self):
+        return len(self.KEYS)
 
-        risk = min((traits["combative"] + styles["curse"]) * 0.8, 1.0)
-        club = min((traits["dominant"] + styles["sexual"] + styles["curse"]) * 0.6, 1.0)
-        hangout = min((traits["supportive"] + traits["curious"]) * 0.6, 1.0)
-
-        vibe = "Active 🔥" if p["recent"] > 3 else "Just Vibing ✨"
-
-
-        # ---------------- PRETTY PROFILE TEXT ----------------
-        pretty_text = (
-            "━━━━━━━━━━━━━━━━━━━━\n"
-            "🧠 SOCIAL PROFILE\n"
-            "━━━━━━━━━━━━━━━━━━━━\n"
-            f"👤 Avatar: {p['name']}\n"
-            f"🔥 Vibe: {vibe}\n"
-            f"📊 Confidence: {bar(int(confidence * 100))} {int(confidence * 100)}%\n\n"
-            "🧩 PERSONALITY\n"
-            + row("💬", "Engaging", int(traits["engaging"] * 100)) + "\n"
-            + row("🧠", "Curious", int(traits["curious"] * 100)) + "\n"
-            + row("😂", "Humorous", int(traits["humorous"] * 100)) + "\n"
-            + row("🤍", "Supportive", int(traits["supportive"] * 100)) + "\n"
-            + row("👑", "Dominant", int(traits["dominant"] * 100)) + "\n"
-            + row("⚔", "Combative", int(traits["combative"] * 100)) + "\n\n"
-            "💋 STYLE\n"
-            + row("💕", "Flirty", int(styles["flirty"] * 100)) + "\n"
-            + row("🔞", "Sexual", int(styles["sexual"] * 100)) + "\n"
-            + row("🤬", "Curse", int(styles["curse"] * 100)) + "\n\n"
-            "🌙 ENERGY\n"
-            + row("🎧", "Hangout", int(hangout * 100)) + "\n"
-            + row("🎉", "Club", int(club * 100)) + "\n"
-            + row("🔥", "Risk", int(risk * 100)) + "\n\n"
-            "📝 Summary\n"
-            + build_summary(confidence, traits, styles) + "\n"
-            "━━━━━━━━━━━━━━━━━━━━"
-        )
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return type(self), (self._scores,)
+
+
+class TraitScores(Scores):
+    __slots__ = ()
+    KEYS = tuple(TRAIT_WEIGHTS)
+    INDEX = {k: i for i, k in enumerate(KEYS)}
+
+
+class StyleScores(Scores):
+    __slots__ = ()
+    KEYS = tuple(STYLE_WEIGHTS)
+    INDEX = {k: i for i, k in enumerate(KEYS)}
+
+
+PROFILE_FIELDS = (
+    "avatar_uuid", "name", "confidence", "vibe", "recent", "traits", "styles",
+    "risk", "club_energy", "hangout_energy", "summary",
+)
+
+class Profile(Mapping):
+    """A derived profile; fields in PROFILE_FIELDS (and JSON) order."""
+
+    __slots__ = PROFILE_FIELDS
+    _FIELDS = frozenset(PROFILE_FIELDS)
+
+    def __init__(self, *values):
+        for k, v in zip(PROFILE_FIELDS, values):
+            setattr(self, k, v)
+
+    def __getitem__(self, key):
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(PROFILE_FIELDS)
+
+    def __len__(self):
+        return len(PROFILE_FIELDS)
+
+    def __repr__(self):
+        return f"Profile({self.as_dict()!r})"
+
+    def __reduce__(self):
+        return Profile, tuple(getattr(self, k) for k in PROFILE_FIELDS)
+
+    def as_dict(self):
+        d = {k: getattr(self, k) for k in PROFILE_FIELDS}
+        d["traits"] = dict(self.traits)
+        d["styles"] = dict(self.styles)
+        return d
+
+
+def decayed_totals(a):
+    """Age-weighted [messages, *hit counts] for an avatar (exponential sums as of a.ref)."""
+    if not STEP_DECAY:
+        return [max(v, 0.0) for v in a.decayed]
+    totals = [0.0] * len(a.sums[0])
+    for w, sums in zip(DECAY_WEIGHTS, a.sums):
+        for i, c in enumerate(sums):
+            totals[i] += c * w
+    return totals
+
+
+def recent_messages(a):
+    if STEP_DECAY:
+        return a.sums[0][0]    # messages in the last hour
+    return a.recent
+
+
+def derive_profile(a):
+    totals = decayed_totals(a)
+    messages, raw = totals[0], totals[1:]
+
+    p = {
+        "avatar_uuid": a.avatar_uuid,
+        "name": a.name,
+        "messages": messages,
+        "raw_traits": {k: raw[i] * TRAIT_WEIGHTS[k] for i, k in enumerate(HIT_KEYS) if k in TRAIT_WEIGHTS},
+        "raw_styles": {k: raw[i] * STYLE_WEIGHTS[k] for i, k in enumerate(HIT_KEYS) if k in STYLE_WEIGHTS},
+        "recent": recent_messages(a)
+    }
+
+    m = max(p["messages"], 1)
+
+    confidence = min(1.0, math.log(m + 1) / 4)
+    damp = max(0.05, confidence ** 1.5)
+
+    traits = {
+        k: min((p["raw_traits"][k] / m) * damp, 1.0)
+        for k in TRAIT_WEIGHTS
+    }
+
+    styles = {
+        k: min((p["raw_styles"][k] / (m * 0.3)) * damp, 1.0)
+        for k in STYLE_WEIGHTS
+    }
+
+    risk = min((traits["combative"] + styles["curse"]) * 0.8, 1.0)
+    club = min((traits["dominant"] + styles["sexual"] + styles["curse"]) * 0.6, 1.0)
+    hangout = min((traits["supportive"] + traits["curious"]) * 0.6, 1.0)
+
+    return profile_from_scores(a, confidence, traits, styles, risk, club, hangout)
+
+
+def profile_from_scores(a, confidence, traits, styles, risk, club, hangout):
+    recent = recent_messages(a)
+    vibe = "Active 🔥" if recent > 3 else "Just Vibing ✨"
+
+    return Profile(
+        a.avatar_uuid,
+        a.name,
+
+        int(confidence * 100),
+        vibe,
+        recent,
+
+        TraitScores(int(traits[k] * 100) for k in TraitScores.KEYS),
+        StyleScores(int(styles[k] * 100) for k in StyleScores.KEYS),
+
+        int(risk * 100),
+        int(club * 100),
+        int(hangout * 100),
+
+        sys.intern(build_summary(confidence, traits, styles))
+    )
+
+
+def render_profile_card(p):
+    t, s = p["traits"], p["styles"]
+    return (
+        "━━━━━━━━━━━━━━━━━━━━\n"
+        "🧠 SOCIAL PROFILE\n"
+        "━━━━━━━━━━━━━━━━━━━━\n"
+        f"👤 Avatar: {p['name']}\n"
+        f"🔥 Vibe: {p['vibe']}\n"
+        f"📊 Confidence: {bar(p['confidence'])} {p['confidence']}%\n\n"
+        "🧩 PERSONALITY\n"
+        + row("💬", "Engaging", t["engaging"]) + "\n"
+        + row("🧠", "Curious", t["curious"]) + "\n"
+        + row("😂", "Humorous", t["humorous"]) + "\n"
+        + row("🤍", "Supportive", t["supportive"]) + "\n"
+        + row("👑", "Dominant", t["dominant"]) + "\n"
+        + row("⚔", "Combative", t["combative"]) + "\n\n"
+        "💋 STYLE\n"
+        + row("💕", "Flirty", s["flirty"]) + "\n"
+        + row("🔞", "Sexual", s["sexual"]) + "\n"
+        + row("🤬", "Curse", s["curse"]) + "\n\n"
+        "🌙 ENERGY\n"
+        + row("🎧", "Hangout", p["hangout_energy"]) + "\n"
+        + row("🎉", "Club", p["club_energy"]) + "\n"
+        + row("🔥", "Risk", p["risk"]) + "\n\n"
+        "📝 Summary\n"
+        + p["summary"] + "\n"
+        "━━━━━━━━━━━━━━━━━━━━"
+    )
+
+
+def rebuild_snapshot(full=True):
+    """
+    full: pushed rows plus a complete feed pass (when a feed is configured).
+    Otherwise only the pushed rows waiting in the ingest buffer are folded in.
+    """
+    now = time.time()
+    if not _STATE["restored"]:
+        restore_agg_state()
+
+    _STATE["unpublished"] = False
+    fetching = [0.0]
+    rows = timed_rows(fetch_rows(), fetching) if full and GOOGLE_PROFILES_FEED else None
+    started = time.perf_counter()
+    aggregate_rows(rows, now, drain_ingest())
+    _STATE["aggregated"] = True
+    if rows is not None:
+        observe("fetch", fetching[0])
+    observe("aggregate", time.perf_counter() - started - fetching[0])
+
+    previous = CACHE["snapshot"]
+    return {
+        "schema": SNAPSHOT_SCHEMA,
+        "profiles": list(AGG["profiles"].values()),
+        "index": dict(AGG["profiles"]),
+        "rows": len(AGG["rows"]),
+        "ts": time.time(),
+        "full_ts": now if full or previous is None else previous.get("full_ts", previous["ts"]),
+        "version": time.time_ns(),
+    }
+
+# =================================================
+# SHARED SNAPSHOT STORE (ONE REFRESHER PER HOST)
+# =================================================
+# One elected worker fetches, scores and publishes; the rest adopt what it
+# wrote. That shares the rebuild, not the memory: every worker unpickles
+# its own copy of the profiles and renders its own derived data and bodies,
+# so resident memory still grows with the worker count.
+
+_SHARED = {"lock_fd": None, "leader_pid": None, "mtime": 0}
 
-        out.append({
-            "avatar_uuid": p["avatar_uuid"],
-            "name": p["name"],
-
-            "confidence": int(confidence * 100),
-            "vibe": vibe,
-            "recent": p["recent"],
-
-            "traits": {k: int(v * 100) for k, v in traits.items()},
-            "styles": {k: int(v * 100) for k, v in styles.items()},
-
-            "risk": int(risk * 100),
-            "club_energy": int(club * 100),
-            "hangout_energy": int(hangout * 100),
-
-            "summary": build_summary(confidence, traits, styles),
-            "pretty_text": pretty_text
-        })
-
- # CACHE EVERYTHING INSIDE THE FUNCTION
-    CACHE["profiles"] = out
-    CACHE["ts"] = time.time()
-    CACHE["platform_metrics"] = {
-    "total_registered": len(total_registered_set),
-    "spoke_24h": len(spoke_24h_set),
-    "live_now": len(live_now_set),
-    "power_users": len(power_users_set),
-    "silent_observers": len(silent_set)
+def open_private(path, flags=os.O_RDONLY):
+    """
+    os.open() for the files next to SNAPSHOT_PATH (created 0600). Refuses a
+    file another user owns or can write: snapshots and state are unpickled,
+    and spooled rows go straight into the aggregator.
+    """
+    fd = os.open(path, flags | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    if hasattr(os, "getuid"):
+        st = os.fstat(fd)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            os.close(fd)
+            raise PermissionError(f"{path} is not private to this user")
+    return fd
+
+
+def is_leader():
+    """
+    Sticky election: the first worker to flock SNAPSHOT_PATH.lock refreshes
+    for everyone until it exits, then the kernel frees the lock and the
+    next worker to poll takes over.
+    """
+    if not SNAPSHOT_PATH or fcntl is None:
+        return True
+    if _SHARED["leader_pid"] == os.getpid():
+        return True
+
+    try:
+        fd = open_private(SNAPSHOT_PATH + ".lock", os.O_RDWR | os.O_CREAT)
+    except PermissionError:
+        app.logger.exception("not competing for leadership")
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+
+    _SHARED["lock_fd"] = fd
+    _SHARED["leader_pid"] = os.getpid()
+    return True
+
+
+def _write_pickle_atomic(path, obj):
+    """Pickle obj to path by write-then-rename; returns the new file's mtime."""
+    # readers only ever see a complete file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix="." + os.path.basename(path) + "-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return os.stat(path).st_mtime_ns
+
+
+def _follow_pickle(path, stamp):
+    """
+    The dict pickled at path if the file changed since stamp["mtime"] and is
+    of this SNAPSHOT_SCHEMA, else None. Moves stamp on to the file read.
+    """
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if st.st_mtime_ns == stamp["mtime"]:
+        return None
+
+    try:
+        with os.fdopen(open_private(path), "rb") as f:
+            obj = pickle.load(f)
+    except Exception:
+        app.logger.exception("unreadable %s", path)
+        return None
+    stamp["mtime"] = st.st_mtime_ns
+
+    if not isinstance(obj, dict) or obj.get("schema") != SNAPSHOT_SCHEMA:
+        app.logger.warning("ignoring %s from another schema", path)
+        return None
+    return obj
+
+
+def save_shared_snapshot(snap):
+    _SHARED["mtime"] = _write_pickle_atomic(SNAPSHOT_PATH, snap)
+
+
+def follow_shared_snapshot():
+    """
+    Adopt the snapshot published by the leader if it is newer than ours,
+    however old it is (a cold worker serves it while the leader refreshes).
+    """
+    snap = _follow_pickle(SNAPSHOT_PATH, _SHARED)
+    if snap is None:
+        return False
+    current = CACHE["snapshot"]
+    if current is not None and current["ts"] >= snap["ts"]:
+        return False
+
+    CACHE["snapshot"] = snap
+    return True
+
+# =================================================
+# SCORING STATE PERSISTENCE (WARM RESTARTS)
+# =================================================
+# The shared snapshot file doubles as the boot snapshot: a restarted worker
+# serves it straight away, whatever its age, while the leader refreshes. The
+# leader also saves AGG beside it, so its first pass after a restart is an
+# incremental diff instead of rescoring every row. Both carry a schema
+# number; the state also carries a fingerprint of everything that feeds the
+# per-row hit counts and their decay, and is discarded if either changed.
+
+SNAPSHOT_SCHEMA = 9
+STATE_PATH = SNAPSHOT_PATH + ".state" if SNAPSHOT_PATH else ""
+SCORING_FINGERPRINT = hashlib.blake2b(repr((
+    TOKEN_RE.pattern, NEGATION_WINDOW, sorted(NEGATORS), HIT_KEYS,
+    DECAY_MODE, DECAY_EDGES, DECAY_HALF_LIFE, RECENT_WINDOW,
+    sorted((k, sorted(v)) for k, v in LEXICONS.items()),
+)).encode(), digest_size=8).hexdigest()
+
+_STATE = {
+    "restored": False, "saved": 0.0, "unpublished": False,
+    "aggregated": False,        # this process has built AGG at least once
+    "activity_moved": True,     # windows moved since the last activity publish
 }
 
-    return out
+def save_agg_state():
+    # holds the refresh lock so AGG can't move underneath the pickler
+    with _REFRESH_LOCK:
+        # activity windows move under /ingest too; they are rebuilt from the avatars on load
+        agg = {k: v for k, v in AGG.items() if k != "activity"}
+        state = {"schema": SNAPSHOT_SCHEMA, "scoring": SCORING_FINGERPRINT, "agg": agg}
+        gc.disable()    # millions of small containers; collection passes only slow this down
+        try:
+            _write_pickle_atomic(STATE_PATH, state)
+        finally:
+            gc.enable()
+        _STATE["saved"] = time.time()
+
+
+def restore_agg_state():
+    """Load the saved AGG into an empty aggregator (once per process)."""
+    _STATE["restored"] = True
+    if not STATE_PATH or AGG["rows"]:
+        return False
+
+    gc.disable()
+    try:
+        with os.fdopen(open_private(STATE_PATH), "rb") as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception:
+        app.logger.exception("unreadable scoring state at %s", STATE_PATH)
+        return False
+    finally:
+        gc.enable()
+
+    if not isinstance(state, dict) or (state.get("schema"), state.get("scoring")) != (
+        SNAPSHOT_SCHEMA, SCORING_FINGERPRINT
+    ):
+        app.logger.warning("scoring state at %s is from another version, rescoring", STATE_PATH)
+        return False
+
+    AGG.update(state["agg"])
+    with _ACTIVITY_LOCK:
+        AGG["activity"] = {kind: ActivityWindow() for kind in ACTIVITY_KINDS}
+    for uid, a in AGG["avatars"].items():
+        _track_activity(uid, a)
+    # re-derive everyone in case profile formulas changed since the save
+    AGG["dirty"] = dict.fromkeys(AGG["avatars"])
+    return True
+
+
+def maybe_save_agg_state(full):
+    if not STATE_PATH or not (full or time.time() - _STATE["saved"] >= STATE_SAVE_INTERVAL):
+        return
+    _STATE["saved"] = time.time()   # claim the slot before the thread gets the lock
+
+    def save():
+        try:
+            save_agg_state()
+        except Exception:
+            app.logger.exception("could not save scoring state to %s", STATE_PATH)
+
+    threading.Thread(target=save, name="state-saver", daemon=True).start()
+
+
+def warm_start():
+    """
+    Serve the last persisted snapshot right away, however old, warm its
+    derived data off-request, and start refreshing behind it.
+    """
+    if follow_shared_snapshot():
+        threading.Thread(
+            target=warm_snapshot, args=(CACHE["snapshot"],), name="snapshot-warmer", daemon=True
+        ).start()
+    ensure_refresher()
+
 # =================================================
-# PLATFORM METRICS
+# PUSH INGESTION (POST /ingest)
 # =================================================
+# The leader keeps pushed rows in a ring buffer that the next refresh drains.
+# Other workers append them to a spool file next to the shared snapshot, and
+# the leader drains that too, so a row lands no matter which worker took it.
+
+INGEST_SPOOL = SNAPSHOT_PATH + ".ingest" if SNAPSHOT_PATH else ""
+INGEST_STATS = {"accepted": 0, "spooled": 0, "dropped": 0}
+_INGEST = deque(maxlen=INGEST_BUFFER)
+
+def normalize_pushed_row(r, now):
+    """A pushed row in fetch_rows() shape; raises ValueError if unusable."""
+    if not isinstance(r, dict):
+        raise ValueError("each row must be an object")
+
+    uid = r.get("avatar_uuid")
+    if not isinstance(uid, str) or not uid.strip():
+        raise ValueError("avatar_uuid is required")
+
+    ts = r.get("timestamp", now)
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)) or not math.isfinite(ts):
+        raise ValueError("timestamp must be unix seconds")
+    if ts > now + INGEST_SKEW:
+        raise ValueError("timestamp is in the future")
+    if ts < now - INGEST_RETENTION:
+        raise ValueError(f"timestamp is older than {INGEST_RETENTION} s")
+
+    msgs = r.get("messages", 0)
+    if isinstance(msgs, float) and msgs.is_integer():
+        msgs = int(msgs)
+    if isinstance(msgs, bool) or not isinstance(msgs, int):
+        raise ValueError("messages must be an integer")
+
+    name = r.get("display_name")
+    if name is None:
+        name = "Unknown"
+    sample = r.get("context_sample")
+    if sample is None:
+        sample = ""
+    if not isinstance(name, str) or not isinstance(sample, str):
+        raise ValueError("display_name and context_sample must be strings")
+
+    return {
+        "avatar_uuid": uid,
+        "display_name": name.strip() or "Unknown",
+        "timestamp": ts,
+        "messages": msgs,
+        "context_sample": sample.strip(),
+    }
 
-def build_platform_metrics():
 
-    # Make sure profiles + metrics are built
-    if not CACHE.get("profiles"):
-        build_profiles()
+def _spool_rows(rows):
+    line = json.dumps(rows, ensure_ascii=False).encode("utf-8") + b"\n"
+    fd = open_private(INGEST_SPOOL, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _drain_spool():
+    try:
+        fd = open_private(INGEST_SPOOL, os.O_RDWR)
+    except FileNotFoundError:
+        return []
+    except PermissionError:
+        app.logger.exception("not draining the ingest spool")
+        return []
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with open(fd, "rb", closefd=False) as f:
+            data = f.read()
+        os.ftruncate(fd, 0)
+    finally:
+        os.close(fd)
 
-    return CACHE.get("platform_metrics", {
-        "total_registered": 0,
-        "spoke_24h": 0,
-        "live_now": 0,
-        "power_users": 0,
-        "silent_observers": 0
-    })
+    rows = []
+    for line in data.splitlines():
+        try:
+            rows.extend(json.loads(line))
+        except ValueError:
+            app.logger.warning("skipping unreadable line in %s", INGEST_SPOOL)
+    return rows
+
+
+def ingest_rows(rows):
+    """Queue normalized rows for the aggregator (here, or via the spool)."""
+    INGEST_STATS["accepted"] += len(rows)
+    if INGEST_SPOOL and fcntl is not None and not is_leader():
+        _spool_rows(rows)
+        INGEST_STATS["spooled"] += len(rows)
+        return
+    _buffer_rows(rows)
+
+
+def _buffer_rows(rows):
+    overflow = len(_INGEST) + len(rows) - INGEST_BUFFER
+    if overflow > 0:
+        INGEST_STATS["dropped"] += overflow   # oldest rows fall off the ring
+    with _ACTIVITY_LOCK:
+        _INGEST.extend(rows)
+        _note_pushed(rows, time.time())
+
+
+def collect_spool():
+    """Buffer rows other workers spooled, so their activity counts before the next fold."""
+    if INGEST_SPOOL and fcntl is not None:
+        rows = _drain_spool()
+        if rows:
+            _buffer_rows(rows)
+
+
+def drain_ingest():
+    with _ACTIVITY_LOCK:
+        rows = list(_INGEST)
+        _INGEST.clear()
+        _NOTED.clear()   # these rows are about to reach the aggregator
+    if INGEST_SPOOL and fcntl is not None:
+        rows.extend(_drain_spool())
+    return rows
+
+
+def fold_ingest():
+    """Fold waiting pushed rows into AGG without publishing a snapshot."""
+    if not _REFRESH_LOCK.acquire(blocking=False):
+        return False
+    try:
+        if not _STATE["restored"]:
+            restore_agg_state()
+        started = time.perf_counter()
+        aggregate_rows(None, time.time(), drain_ingest())
+        observe("aggregate", time.perf_counter() - started)
+        _STATE["unpublished"] = True
+        return True
+    finally:
+        _REFRESH_LOCK.release()
+
+
+def ingest_pending():
+    if _INGEST or AGG["dirty"]:
+        return True
+    if not INGEST_SPOOL or fcntl is None:
+        return False
+    try:
+        return os.stat(INGEST_SPOOL).st_size > 0
+    except FileNotFoundError:
+        return False
+
+# =================================================
+# SNAPSHOT REFRESHER (STALE-WHILE-REVALIDATE)
+# =================================================
+
+_REFRESH_LOCK = threading.Lock()
+_REFRESHER_LOCK = threading.Lock()
+_REFRESHER = {"pid": None}
+
+def refresh_snapshot(wait=False, full=True):
+    """
+    Rebuild and publish a new snapshot. Single-flight: while one rebuild
+    runs, other callers return immediately (or queue up if wait=True).
+    A failed rebuild keeps serving the last good snapshot.
+    full=False only folds in pushed rows (no feed request).
+    """
+    if not _REFRESH_LOCK.acquire(blocking=wait):
+        return False
+
+    started = time.perf_counter()
+    try:
+        if wait and CACHE["snapshot"] is not None:
+            return False  # someone else finished it while we waited
+        snap = profiled("rebuild" if full else "rebuild_push", rebuild_snapshot, full)
+        CACHE["snapshot"] = snap
+    except (FeedError, requests.RequestException) as e:
+        if CACHE["snapshot"] is None:
+            raise
+        app.logger.warning("profile feed unavailable (%s), serving last good snapshot", e)
+        return False
+    except Exception:
+        if CACHE["snapshot"] is None:
+            raise
+        app.logger.exception("profile refresh failed, serving last good snapshot")
+        return False
+    finally:
+        _REFRESH_LOCK.release()
+
+    if SNAPSHOT_PATH:
+        try:
+            timed("publish", save_shared_snapshot, snap)
+        except OSError:
+            app.logger.exception("could not publish shared snapshot to %s", SNAPSHOT_PATH)
+        maybe_save_agg_state(full)
+    timed("warm", warm_snapshot, snap)
+    publish_activity()
+    observe("refresh" if full else "refresh_push", time.perf_counter() - started)
+    return True
+
+
+def _refresh_loop():
+    # nothing may end this thread: ensure_refresher() never starts another
+    while True:
+        try:
+            _refresh_schedule()
+        except Exception:
+            app.logger.exception("profile refresher failed, restarting it")
+            time.sleep(REFRESH_RETRY)
+
+
+def _refresh_schedule():
+    retry_at = 0
+    failures = 0
+    # a worker that starts out as leader refreshes a snapshot it found on disk right away
+    boot = time.time()
+    while True:
+        flush_metrics()
+        if not is_leader():
+            boot = 0
+            if follow_shared_snapshot():
+                warm_snapshot(CACHE["snapshot"])
+            time.sleep(SNAPSHOT_POLL)
+            continue
+
+        # a newly promoted leader starts from whatever its predecessor wrote
+        if follow_shared_snapshot():
+            warm_snapshot(CACHE["snapshot"])
+
+        snap = CACHE["snapshot"]
+        due = snap.get("full_ts", snap["ts"]) + CACHE_TTL - REFRESH_AHEAD if snap else 0
+        due = 0 if snap and snap["ts"] < boot else max(due, retry_at)
+        boot = 0
+        now = time.time()
+        if due <= now:
+            try:
+                refreshed = refresh_snapshot()
+            except Exception:
+                # only a cold start raises: there is no snapshot to fall back on
+                app.logger.exception("first profile refresh failed")
+                refreshed = False
+            if refreshed:
+                failures = 0
+            else:
+                failures += 1
+                retry_at = time.time() + min(REFRESH_RETRY * 2 ** (failures - 1), REFRESH_RETRY_MAX)
+            continue
+        if snap is None:
+            time.sleep(due - now)   # backing off before another cold-start attempt
+            continue
+
+        # between full passes, fold pushed rows in every INGEST_FLUSH seconds
+        # but publish them only every INGEST_PUBLISH: each publish costs every
+        # worker an unpickle and a full warm
+        if ingest_pending():
+            fold_ingest()
+        if _STATE["unpublished"] and now - snap["ts"] >= INGEST_PUBLISH:
+            refresh_snapshot(full=False)
+        time.sleep(min(due - now, INGEST_FLUSH))
+
+
+def ensure_refresher():
+    # one scheduler per process (gunicorn forks workers after import)
+    if _REFRESHER["pid"] == os.getpid():
+        return
+    with _REFRESHER_LOCK:
+        if _REFRESHER["pid"] == os.getpid():
+            return
+        threading.Thread(target=_refresh_loop, name="profile-refresher", daemon=True).start()
+        threading.Thread(target=_activity_loop, name="activity-publisher", daemon=True).start()
+        _REFRESHER["pid"] = os.getpid()
+
+
+def current_snapshot():
+    """
+    Last good snapshot. Only a cold start with nothing on disk waits on the
+    feed; after that requests never block on a rebuild.
+    """
+    if CACHE["snapshot"] is None and not follow_shared_snapshot():
+        refresh_snapshot(wait=True)
+
+    ensure_refresher()
+
+    snap = CACHE["snapshot"]
+    stale = time.time() - snap.get("full_ts", snap["ts"]) >= CACHE_TTL
+    if stale and not _REFRESH_LOCK.locked() and is_leader():
+        # scheduler fell behind (sleep skew, failures) — kick it off-request
+        threading.Thread(target=refresh_snapshot, daemon=True).start()
+
+    return snap
+
+
+def build_profiles():
+    return current_snapshot()["profiles"]
+
+# =================================================
+# ACTIVITY PUBLISHING
+# =================================================
+# Every ACTIVITY_PUBLISH seconds the leader buffers whatever the other workers
+# spooled (moving its windows) and, if the windows moved, exports them into
+# CACHE and SNAPSHOT_PATH.activity. Followers adopt that file on the same
+# timer. None of it waits on a feed pass or a profile snapshot.
+
+ACTIVITY_PATH = SNAPSHOT_PATH + ".activity" if SNAPSHOT_PATH else ""
+_ACTIVITY_FILE = {"mtime": None}
+
+def publish_activity():
+    """Export the activity windows if they moved since the last publish."""
+    if not _STATE["aggregated"] or not _STATE["activity_moved"]:
+        return False
+    _STATE["activity_moved"] = False
+    activity = export_activity(time.time())
+    CACHE["activity"] = activity
+    if ACTIVITY_PATH:
+        try:
+            _ACTIVITY_FILE["mtime"] = _write_pickle_atomic(ACTIVITY_PATH, activity)
+        except OSError:
+            app.logger.exception("could not publish activity to %s", ACTIVITY_PATH)
+    return True
+
+
+def follow_activity():
+    """Adopt the activity the leader published if it is newer than ours."""
+    activity = _follow_pickle(ACTIVITY_PATH, _ACTIVITY_FILE)
+    if activity is None:
+        return False
+    current = CACHE["activity"]
+    if current is not None and current["ts"] >= activity["ts"]:
+        return False
+
+    CACHE["activity"] = activity
+    return True
+
+
+def _activity_loop():
+    while True:
+        time.sleep(ACTIVITY_PUBLISH)
+        try:
+            # a new leader keeps following until its first pass has filled AGG
+            if is_leader() and _STATE["aggregated"]:
+                collect_spool()
+                publish_activity()
+            else:
+                follow_activity()
+        except Exception:
+            app.logger.exception("activity publish failed")
+
+
+def current_activity():
+    """Last published activity, else this process's own windows."""
+    if CACHE["activity"] is None and not follow_activity():
+        return export_activity(time.time())
+    return CACHE["activity"]
+
+
+def profile_index():
+    """avatar_uuid -> profile for the current snapshot."""
+    return current_snapshot()["index"]
+
+# =================================================
+# PER-SNAPSHOT MEMO (CARDS, RANKINGS, BODIES)
+# =================================================
+# Anything derived from a snapshot is computed on first use and dropped when
+# a new snapshot version is published. Kept out of the snapshot dict itself so
+# it never ends up in the shared pickle.
+
+_DERIVED = {"version": None, "items": {}}
+_DERIVED_LOCK = threading.Lock()
+DERIVED_STATS = {"hits": 0, "misses": 0}
+
+def snapshot_cached(snap, key, build):
+    version = snap["version"]
+    with _DERIVED_LOCK:
+        if _DERIVED["version"] is None or version > _DERIVED["version"]:
+            _DERIVED["version"] = version
+            _DERIVED["items"] = {}
+        # a request still holding an older snapshot just computes uncached
+        items = _DERIVED["items"] if _DERIVED["version"] == version else None
+        if items is not None and key in items:
+            DERIVED_STATS["hits"] += 1
+            return items[key]
+        DERIVED_STATS["misses"] += 1
+
+    value = build()
+
+    if items is not None:
+        with _DERIVED_LOCK:
+            value = items.setdefault(key, value)
+    return value
+
+
+SNAPSHOT_WARMERS = []   # fn(snap) run off-request whenever a snapshot is published
+
+def profile_positions(snap):
+    """avatar_uuid -> row in snap["profiles"] (and in the match index)."""
+    return snapshot_cached(
+        snap, "positions", lambda: {p["avatar_uuid"]: i for i, p in enumerate(snap["profiles"])}
+    )
+
+
+def warm_snapshot(snap):
+    for warm in SNAPSHOT_WARMERS:
+        try:
+            warm(snap)
+        except Exception:
+            app.logger.exception("warming %s failed", warm.__name__)
+
+
+def profile_card(snap, p):
+    return snapshot_cached(
+        snap, ("card", p["avatar_uuid"]), lambda: timed("render_card", render_profile_card, p)
+    )
+
+
+def with_card(snap, p):
+    return dict(p.as_dict(), pretty_text=profile_card(snap, p))
+
+# =================================================
+# PLATFORM METRICS
+# =================================================
+
+def build_platform_metrics(activity=None, now=None):
+    # windows slide with the clock, not with the publish
+    if activity is None:
+        current_snapshot()   # a cold start waits for the first pass
+        activity = current_activity()
+    return window_counts(activity, time.time() if now is None else now)
 
 # =================================================
 # ROOM VIBE HELPERS (REQUIRED)
 # =================================================
 
-def presence_summary(profiles):
-    if not profiles:
-        return "None"
+# A room reading only needs sums over its members, so each profile reduces
+# to its share of those sums and a room to the total of its members' shares.
+# Shares are integers, so adding and removing members is exact.
+
+ROOM_FIELDS = (
+    "members",
+    # vibe scores, over members who chatted recently
+    "live", "playful", "warm", "flirty", "focused", "tense", "chaotic",
+    # presence: members at 40+ in each trait
+    "Dominant", "Humorous", "Supportive", "Combative",
+    # live chat: recent messages, members at 50+ confidence
+    "recent", "confident",
+)
+VIBE_SCORES = ("playful", "warm", "flirty", "focused", "tense")
+
+
+def room_share(p):
+    """One profile's contribution to a room tally, in ROOM_FIELDS order."""
+    t, s = p.get("traits", {}), p.get("styles", {})
+    recent = p.get("recent", 0)
+    if recent > 0:
+        vibe = (
+            1, t["humorous"], t["supportive"], s["flirty"] + s["sexual"], t["curious"],
+            t["combative"] + s["curse"], int(t["combative"] > 50 and s["curse"] > 40),
+        )
+    else:
+        vibe = (0,) * 7
+    return (1,) + vibe + (
+        int(t.get("dominant", 0) >= 40),
+        int(t.get("humorous", 0) >= 40),
+        int(t.get("supportive", 0) >= 40),
+        int(t.get("combative", 0) >= 40),
+        recent,
+        int(p.get("confidence", 0) >= 50),
+    )
 
-    trait_counts = {
-        "Dominant": 0,
-        "Humorous": 0,
-        "Supportive": 0,
-        "Combative": 0
-    }
 
-    for p in profiles:
-        t = p.get("traits", {})
-        if t.get("dominant", 0) >= 40:
-            trait_counts["Dominant"] += 1
-        if t.get("humorous", 0) >= 40:
-            trait_counts["Humorous"] += 1
-        if t.get("supportive", 0) >= 40:
-            trait_counts["Supportive"] += 1
-        if t.get("combative", 0) >= 40:
-            trait_counts["Combative"] += 1
+def room_tally(profiles):
+    shares = [room_share(p) for p in profiles]
+    return tuple(map(sum, zip(*shares))) if shares else (0,) * len(ROOM_FIELDS)
+
+
+def tally_scores(tally):
+    """score_room_vibe() for the room a tally describes."""
+    if not tally[1]:
+        return {}
+    scores = dict(zip(VIBE_SCORES, tally[2:7]))
+    if tally[7]:
+        scores["chaotic"] = 2 * tally[7]
+    return scores
+
+
+def tally_presence(tally):
+    if not tally[0]:
+        return "None"
 
+    trait_counts = dict(zip(ROOM_FIELDS[8:12], tally[8:12]))
     ranked = sorted(trait_counts.items(), key=lambda x: x[1], reverse=True)
     top = [name for name, count in ranked if count > 0][:2]
 
     return " • ".join(top) if top else "Mixed personalities"
 
 
-def live_chat_summary(profiles):
-    total_recent = sum(p.get("recent", 0) for p in profiles)
-    high_conf = sum(1 for p in profiles if p.get("confidence", 0) >= 50)
+def tally_live_chat(tally):
+    recent, high_conf = tally[12], tally[13]
 
-    if total_recent >= 15:
+    if recent >= 15:
         return "Buzzing"
-    if total_recent >= 6:
+    if recent >= 6:
         return "Active"
-    if total_recent > 0:
+    if recent > 0:
         return "Warming Up"
 
     if high_conf >= 3:
@@ -496,6 +2320,14 @@ def live_chat_summary(profiles):
     return "Quiet"
 
 
+def presence_summary(profiles):
+    return tally_presence(room_tally(profiles))
+
+
+def live_chat_summary(profiles):
+    return tally_live_chat(room_tally(profiles))
+
+
 # =================================================
 # ROOM VIBE ADD-ONS (NEW, NON-DESTRUCTIVE)
 # =================================================
@@ -510,29 +2342,15 @@ VIBE_ADJECTIVES = {
     "quiet": ["Calm","Still","Reserved"]
 }
 
-_LAST_ADJ = None
-
-def rotate_adjective(vibe):
-    global _LAST_ADJ
+def rotate_adjective(vibe, last=None):
+    # `last` is the room's previous adjective; callers keep one per room
     for a in VIBE_ADJECTIVES.get(vibe, ["Neutral"]):
-        if a != _LAST_ADJ:
-            _LAST_ADJ = a
+        if a != last:
             return a
     return VIBE_ADJECTIVES[vibe][0]
 
 def score_room_vibe(profiles):
-    scores = defaultdict(float)
-    for p in profiles:
-        if p["recent"] <= 0: continue
-        t, s = p["traits"], p["styles"]
-        scores["playful"] += t["humorous"]
-        scores["warm"] += t["supportive"]
-        scores["flirty"] += s["flirty"] + s["sexual"]
-        scores["focused"] += t["curious"]
-        scores["tense"] += t["combative"] + s["curse"]
-        if t["combative"] > 50 and s["curse"] > 40:
-            scores["chaotic"] += 2
-    return scores
+    return tally_scores(room_tally(profiles))
 
 def resolve_room_vibe(scores):
     if not scores:
@@ -548,13 +2366,17 @@ def resolve_room_vibe(scores):
         return top[0], "Clear" if share >= 0.5 else "Forming"
     return "quiet", "Shifting"
 
-def build_room_vibe_enhanced(profiles):
-    scores = score_room_vibe(profiles)
-    vibe, clarity = resolve_room_vibe(scores)
-    adjective = rotate_adjective(vibe)
+def build_room_vibe_enhanced(profiles, tally=None, last_adjective=None):
+    pretty, html, _ = room_vibe_text(room_tally(profiles) if tally is None else tally, last_adjective)
+    return pretty, html
+
+def room_vibe_text(tally, last_adjective=None):
+    """(pretty, html, adjective) for a room tally."""
+    vibe, clarity = resolve_room_vibe(tally_scores(tally))
+    adjective = rotate_adjective(vibe, last_adjective)
 
-    live = live_chat_summary(profiles)
-    presence = presence_summary(profiles)
+    live = tally_live_chat(tally)
+    presence = tally_presence(tally)
 
     pretty = (
         "━━━━━━━━━━━━━━━━━━━━\n"
@@ -577,8 +2399,8 @@ def build_room_vibe_enhanced(profiles):
         "impression": f"{adjective} room. Easy to enter without overcommitting."
     }
 
-    return pretty, html
-    
+    return pretty, html, adjective
+
 # =================================================
 # MATCHING ADD-ONS (NEW, NON-DESTRUCTIVE)
 # =================================================
@@ -677,6 +2499,241 @@ def build_match_pretty(source, similar, complement, hybrid):
     
 build_best_match_pretty = build_match_pretty
 
+
+def build_topk_match_pretty(source, similar, complement, hybrid):
+    """Same card as build_match_pretty, listing up to k names per category."""
+    def names(matches):
+        if not matches:
+            return "   No strong match yet\n"
+        return "".join(f"   {i}. {p['name']}\n" for i, (p, _) in enumerate(matches, 1))
+
+    return (
+        "━━━━━━━━━━━━━━━━━━━━\n"
+        "💞 BEST MATCHES\n"
+        "━━━━━━━━━━━━━━━━━━━━\n"
+        f"👤 You: {source['name']}\n\n"
+
+        f"{MATCH_ICONS['similar']} Similar Energy\n" + names(similar) + "\n"
+        f"{MATCH_ICONS['complement']} Complementary Energy\n" + names(complement) + "\n"
+        f"{MATCH_ICONS['hybrid']} Hybrid Balance\n" + names(hybrid) + "\n"
+
+        "🌙 Tip\n"
+        "🧬 Similar feels natural\n"
+        "🔀 Complement sparks growth\n"
+        "⚖️ Hybrid builds long-term flow\n"
+        "━━━━━━━━━━━━━━━━━━━━"
+    )
+
+# =================================================
+# VECTORIZED SCORING (OPTIONAL, NUMPY)
+# =================================================
+# Same formulas as derive_profile(), evaluated as array operations over a
+# batch of avatars. Operations run in the same order as the dict path so
+# results are identical.
+#
+# Only derivation is vectorised. Matches come from the k-d match index and
+# room readings from integer room tallies, both cheaper than a dense
+# trait/style matrix scan, so there is no score matrix.
+
+TRAIT_KEYS = tuple(TRAIT_WEIGHTS)
+STYLE_KEYS = tuple(STYLE_WEIGHTS)
+T_IDX = {k: i for i, k in enumerate(TRAIT_KEYS)}
+S_IDX = {k: i for i, k in enumerate(STYLE_KEYS)}
+NP_MIN_BATCH = 64   # below this the dict loops are faster than array setup
+
+
+def derive_profiles_np(avatars):
+    if STEP_DECAY:
+        sums = np.array([a.sums for a in avatars], dtype=np.float64).reshape(
+            len(avatars), len(DECAY_WEIGHTS), len(HIT_KEYS) + 1
+        )
+        decayed = sums[:, 0] * DECAY_WEIGHTS[0]
+        for b in range(1, len(DECAY_WEIGHTS)):
+            decayed = decayed + sums[:, b] * DECAY_WEIGHTS[b]
+    else:
+        decayed = np.maximum(np.array([a.decayed for a in avatars], dtype=np.float64), 0.0)
+
+    m = np.maximum(decayed[:, 0], 1)
+    confidence = np.minimum(1.0, np.log(m + 1) / 4)
+    damp = np.maximum(0.05, confidence ** 1.5)
+
+    nt = len(TRAIT_KEYS)
+    traits = np.minimum(
+        (decayed[:, 1:1 + nt] * np.array([TRAIT_WEIGHTS[k] for k in TRAIT_KEYS]) / m[:, None]) * damp[:, None],
+        1.0
+    )
+    styles = np.minimum(
+        (decayed[:, 1 + nt:] * np.array([STYLE_WEIGHTS[k] for k in STYLE_KEYS]) / (m * 0.3)[:, None]) * damp[:, None],
+        1.0
+    )
+
+    t, s = T_IDX, S_IDX
+    risk = np.minimum((traits[:, t["combative"]] + styles[:, s["curse"]]) * 0.8, 1.0)
+    club = np.minimum((traits[:, t["dominant"]] + styles[:, s["sexual"]] + styles[:, s["curse"]]) * 0.6, 1.0)
+    hangout = np.minimum((traits[:, t["supportive"]] + traits[:, t["curious"]]) * 0.6, 1.0)
+
+    return [
+        profile_from_scores(a, c, dict(zip(TRAIT_KEYS, tr)), dict(zip(STYLE_KEYS, st)), r, cl, h)
+        for a, c, tr, st, r, cl, h in zip(
+            avatars, confidence.tolist(), traits.tolist(), styles.tolist(),
+            risk.tolist(), club.tolist(), hangout.tolist()
+        )
+    ]
+
+# =================================================
+# TOP-K MATCH INDEX (KD-TREE)
+# =================================================
+# Built once per snapshot over each avatar's traits + styles, with a bounding
+# box per node. A query walks nodes best-bound-first and stops once no
+# unvisited box can beat the k-th best score, so one index serves all three
+# match kinds: similarity bounds by the nearest point of a box, complement
+# by each min() term's largest reachable value. Ties go to the earlier
+# profile, exactly like find_best_matches().
+
+MATCH_DIMS = TRAIT_KEYS + ("flirty", "sexual", "curse")
+MATCH_MAX_K = 10
+KD_LEAF_SIZE = 32
+
+_D = {k: i for i, k in enumerate(MATCH_DIMS)}
+_NT = len(TRAIT_KEYS)
+
+
+def build_match_index(profiles):
+    vecs = [
+        tuple(p["traits"][k] for k in TRAIT_KEYS) + tuple(p["styles"][k] for k in STYLE_KEYS)
+        for p in profiles
+    ]
+    nodes = []   # (lo, hi, first position in subtree, left, right, leaf items or None)
+
+    def build(items):
+        lo = tuple(min(vecs[i][d] for i in items) for d in range(len(MATCH_DIMS)))
+        hi = tuple(max(vecs[i][d] for i in items) for d in range(len(MATCH_DIMS)))
+        spread, dim = max((h - l, d) for d, (l, h) in enumerate(zip(lo, hi)))
+
+        node = len(nodes)
+        nodes.append((lo, hi, min(items), None, None, sorted(items)))
+        if len(items) <= KD_LEAF_SIZE or spread == 0:
+            return node
+
+        items.sort(key=lambda i: vecs[i][dim])
+        mid = len(items) // 2
+        nodes[node] = (lo, hi, nodes[node][2], build(items[:mid]), build(items[mid:]), None)
+        return node
+
+    if profiles:
+        build(list(range(len(profiles))))
+    return {"vecs": vecs, "nodes": nodes}
+
+
+def _similar_fns(a):
+    a0, a1, a2, a3, a4, a5 = a[:_NT]
+    sqrt = math.sqrt
+
+    def score(b):
+        return max(0, 100 - sqrt(
+            (a0 - b[0]) ** 2 + (a1 - b[1]) ** 2 + (a2 - b[2]) ** 2
+            + (a3 - b[3]) ** 2 + (a4 - b[4]) ** 2 + (a5 - b[5]) ** 2
+        ))
+
+    def bound(lo, hi):
+        gap = 0
+        for d in range(_NT):
+            if a[d] < lo[d]:
+                gap += (lo[d] - a[d]) ** 2
+            elif a[d] > hi[d]:
+                gap += (a[d] - hi[d]) ** 2
+        return max(0, 100 - sqrt(gap))
+
+    return score, bound
+
+
+def _complement_fns(a):
+    dom, sup, cur, eng, cmb = (_D[k] for k in ("dominant", "supportive", "curious", "engaging", "combative"))
+    fl, sx = _D["flirty"], _D["sexual"]
+
+    a_dom, a_sup, a_cur, a_eng, a_cmb, a_fl, a_sx = (a[d] for d in (dom, sup, cur, eng, cmb, fl, sx))
+
+    def score(b):
+        sc = (min(a_dom, b[sup]) + min(b[dom], a_sup)
+              + min(a_cur, b[eng]) + min(b[cur], a_eng)
+              + min(a_fl, b[fl]) + min(a_sx, b[sx])
+              - abs(a_cmb - b[cmb]))
+        return max(0, min(sc, 100))
+
+    def bound(lo, hi):
+        nearest = min(max(a[cmb], lo[cmb]), hi[cmb])
+        sc = (min(a[dom], hi[sup]) + min(hi[dom], a[sup])
+              + min(a[cur], hi[eng]) + min(hi[cur], a[eng])
+              + min(a[fl], hi[fl]) + min(a[sx], hi[sx])
+              - abs(a[cmb] - nearest))
+        return max(0, min(sc, 100))
+
+    return score, bound
+
+
+def _hybrid_fns(a):
+    sim, sim_bound = _similar_fns(a)
+    comp, comp_bound = _complement_fns(a)
+    return (
+        lambda b: hybrid_score(sim(b), comp(b)),
+        lambda lo, hi: hybrid_score(sim_bound(lo, hi), comp_bound(lo, hi)),
+    )
+
+
+def _index_topk(index, score, bound, k, exclude):
+    vecs, nodes = index["vecs"], index["nodes"]
+    if not nodes:
+        return []
+
+    best = []   # min-heap of (score, -position): worst kept match on top
+    frontier = [(-bound(nodes[0][0], nodes[0][1]), nodes[0][2], 0)]
+
+    while frontier:
+        neg_bound, first, node = heapq.heappop(frontier)
+        if len(best) == k and (-neg_bound, -first) < best[0]:
+            # nothing left can beat the k-th match, even on the position tie-break
+            break
+
+        lo, hi, _, left, right, items = nodes[node]
+        if items is None:
+            for child in (left, right):
+                c = nodes[child]
+                heapq.heappush(frontier, (-bound(c[0], c[1]), c[2], child))
+            continue
+
+        for i in items:
+            if i == exclude:
+                continue
+            entry = (score(vecs[i]), -i)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+    return [(-neg_i, sc) for sc, neg_i in sorted(best, reverse=True)]
+
+
+def match_index(snap):
+    return snapshot_cached(snap, "match_index", lambda: build_match_index(snap["profiles"]))
+
+SNAPSHOT_WARMERS.append(match_index)
+
+
+def find_top_matches(snap, source, k=1):
+    """
+    Top-k similar, complementary and hybrid matches for source, each a list
+    of (profile, score) best first.
+    """
+    index = match_index(snap)
+    profiles = snap["profiles"]
+    i = profile_positions(snap)[source["avatar_uuid"]]
+    a = index["vecs"][i]
+
+    return tuple(
+        [(profiles[j], sc) for j, sc in _index_topk(index, score, bound, k, i)]
+        for score, bound in (_similar_fns(a), _complement_fns(a), _hybrid_fns(a))
+    )
+
 # =================================================
 # LEADERBOARD ENGINE (NEW, NON-DESTRUCTIVE)
 # =================================================
@@ -719,11 +2776,75 @@ def lb_block(title, icon, ranked, key_fn):
     return text + "\n"
 
 
-def build_leaderboard_pretty(profiles):
+LEADERBOARD_TOP = 3
+
+LEADERBOARD_CATEGORIES = (
+    # PERSONALITY
+    ("confidence", "📊 Confidence"),
+    ("engaging", "💬 Engaging"),
+    ("curious", "🧠 Curious"),
+    ("humorous", "😂 Humorous"),
+    ("supportive", "🤍 Supportive"),
+    ("dominant", "👑 Dominant"),
+    ("combative", "⚔ Combative"),
+
+    # STYLE
+    ("flirty", "💕 Flirty"),
+    ("sexual", "🔞 Sexual"),
+    ("curse", "🤬 Curse"),
+
+    # ENERGY
+    ("hangout_energy", "🎧 Hangout Energy"),
+    ("club_energy", "🎉 Club Energy"),
+    ("risk", "🔥 Risk Energy"),
+)
+
+
+def leaderboard_values(p):
+    """A profile's score in each LEADERBOARD_CATEGORIES slot, in order."""
+    t, s = p["traits"], p["styles"]
+    return (
+        p["confidence"],
+        t["engaging"], t["curious"], t["humorous"], t["supportive"], t["dominant"], t["combative"],
+        s["flirty"], s["sexual"], s["curse"],
+        p["hangout_energy"], p["club_energy"], p["risk"],
+    )
+
+
+def build_rankings(profiles, top=LEADERBOARD_TOP):
+    """
+    Top-N per leaderboard category in a single pass, one bounded heap each.
+    Ties keep snapshot order, same as sorted(..., reverse=True)[:N].
+    """
+    heaps = [[] for _ in LEADERBOARD_CATEGORIES]
+
+    for pos, p in enumerate(profiles):
+        for h, v in zip(heaps, leaderboard_values(p)):
+            if len(h) < top:
+                heapq.heappush(h, (v, -pos))
+            elif v > h[0][0]:   # a tie never beats an earlier profile
+                heapq.heapreplace(h, (v, -pos))
+
+    return {
+        key: [profiles[-neg_pos] for _, neg_pos in sorted(h, reverse=True)]
+        for h, (key, _) in zip(heaps, LEADERBOARD_CATEGORIES)
+    }
+
+
+def leaderboard_rankings(snap):
+    return snapshot_cached(snap, "rankings", lambda: build_rankings(snap["profiles"]))
+
+SNAPSHOT_WARMERS.append(leaderboard_rankings)
+
+
+def build_leaderboard_pretty(profiles, rankings=None):
 
     if not profiles:
         return "No leaderboard data available."
 
+    if rankings is None:
+        rankings = build_rankings(profiles)
+
     pretty = "━━━━━━━━━━━━━━━━━━━━\n"
     pretty += "🏆 SL SOCIAL EXPERIMENT\n"
     pretty += "COMPETITIVE LEADERBOARD\n"
@@ -731,9 +2852,7 @@ def build_leaderboard_pretty(profiles):
 
     medals = ["🥇", "🥈", "🥉"]
 
-    def top3(title, key_fn):
-        ranked = sorted(profiles, key=key_fn, reverse=True)[:3]
-
+    def top3(title, ranked, key_fn):
         if not ranked or key_fn(ranked[0]) <= 0:
             return ""  # skip empty categories
 
@@ -747,29 +2866,623 @@ def build_leaderboard_pretty(profiles):
 
         return block + "\n"
 
-    # PERSONALITY
-    pretty += top3("📊 Confidence", lambda p: p["confidence"])
-    pretty += top3("💬 Engaging", lambda p: p["traits"]["engaging"])
-    pretty += top3("🧠 Curious", lambda p: p["traits"]["curious"])
-    pretty += top3("😂 Humorous", lambda p: p["traits"]["humorous"])
-    pretty += top3("🤍 Supportive", lambda p: p["traits"]["supportive"])
-    pretty += top3("👑 Dominant", lambda p: p["traits"]["dominant"])
-    pretty += top3("⚔ Combative", lambda p: p["traits"]["combative"])
-
-    # STYLE
-    pretty += top3("💕 Flirty", lambda p: p["styles"]["flirty"])
-    pretty += top3("🔞 Sexual", lambda p: p["styles"]["sexual"])
-    pretty += top3("🤬 Curse", lambda p: p["styles"]["curse"])
-
-    # ENERGY
-    pretty += top3("🎧 Hangout Energy", lambda p: p["hangout_energy"])
-    pretty += top3("🎉 Club Energy", lambda p: p["club_energy"])
-    pretty += top3("🔥 Risk Energy", lambda p: p["risk"])
+    for i, (key, title) in enumerate(LEADERBOARD_CATEGORIES):
+        pretty += top3(title, rankings[key], lambda p: leaderboard_values(p)[i])
 
     pretty += "━━━━━━━━━━━━━━━━━━━━"
 
     return pretty
 
+# =================================================
+# ENCODED RESPONSE BODIES (ETAG / 304)
+# =================================================
+# Snapshot-derived JSON is encoded to bytes once per snapshot version. The
+# ETag is a digest of those bytes, so every worker holding the same data
+# hands out the same tag and a poller that already has it gets a bare 304.
+# Larger bodies are also compressed at the same time (gzip, plus brotli when
+# installed); each encoding is its own representation with its own ETag.
+
+BODY_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "no-cache",    # always revalidate; the 304 is nearly free
+    "Vary": "Accept-Encoding",
+}
+
+COMPRESS_MIN_BYTES = 1024   # below this the headers outweigh the savings
+GZIP_LEVEL = 6              # 9 is ~4x slower for ~14% less on the big bodies
+BROTLI_QUALITY = 9          # 10-11 are far slower for a few % more
+
+def encode_variants(body):
+    """{content-coding: (bytes, etag)}, always including "identity"."""
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    variants = {"identity": (body, etag)}
+    if len(body) < COMPRESS_MIN_BYTES:
+        return variants
+
+    packed = {"gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        packed["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    for coding, data in packed.items():
+        if len(data) < len(body):
+            variants[coding] = (data, f"{etag}-{coding}")
+    return variants
+
+
+def body_ready(snap, key):
+    """Whether snapshot_body() already holds this response for snap."""
+    with _DERIVED_LOCK:
+        return _DERIVED["version"] == snap["version"] and ("body",) + key in _DERIVED["items"]
+
+
+def snapshot_body(snap, key, encode):
+    """encode_variants() of one response, built once per snapshot version."""
+    return snapshot_cached(snap, ("body",) + key, lambda: timed("encode_body", lambda: encode_variants(encode())))
+
+
+def leaderboard_body(snap, cards=False):
+    if cards:
+        profiles = [with_card(snap, p) for p in snap["profiles"]]
+    else:
+        profiles = [p.as_dict() for p in snap["profiles"]]
+    return json.dumps(profiles).encode("utf-8")
+
+
+def leaderboard_sl_body(snap):
+    pretty = snapshot_cached(
+        snap, "leaderboard_pretty",
+        lambda: timed(
+            "render_leaderboard", build_leaderboard_pretty, snap["profiles"], leaderboard_rankings(snap)
+        )
+    )
+    return json.dumps({"pretty_text": pretty}, ensure_ascii=False).encode("utf-8")
+
+
+def leaderboard_live_body(snap):
+    # Rotate trait here if you want later
+    trait_key = "confidence"
+    trait_label = "Confidence"
+
+    top = [
+        {"name": p["name"], "score": p["confidence"]}
+        for p in leaderboard_rankings(snap)[trait_key]
+    ]
+    return json.dumps({"trait": trait_label, "top": top}, ensure_ascii=False).encode("utf-8")
+
+
+def platform_metrics_body(activity, bucket):
+    return json.dumps(build_platform_metrics(activity, bucket * ACTIVITY_BUCKET)).encode("utf-8")
+
+
+_PLATFORM_BODY = {"cached": None}   # ((activity version, bucket), variants)
+
+def platform_metrics_variants(activity, bucket):
+    # every window is whole buckets, so the body only changes with the bucket or a publish
+    key = (activity["version"], bucket)
+    cached = _PLATFORM_BODY["cached"]
+    if cached is None or cached[0] != key:
+        cached = _PLATFORM_BODY["cached"] = (key, encode_variants(platform_metrics_body(activity, bucket)))
+    return cached[1]
+
+
+RESPONSE_BODIES = {
+    # key -> (encoder(snap, *variant), mimetype); rendered cards are left to first use
+    ("leaderboard", False): (lambda snap: leaderboard_body(snap), "application/json"),
+    ("leaderboard", True): (lambda snap: leaderboard_body(snap, cards=True), "application/json"),
+    ("leaderboard_sl",): (leaderboard_sl_body, "application/json; charset=utf-8"),
+    ("leaderboard_live",): (leaderboard_live_body, "application/json; charset=utf-8"),
+}
+WARM_BODIES = (("leaderboard", False), ("leaderboard_sl",), ("leaderboard_live",))
+
+
+def cached_response(snap, key, *variant):
+    encode, mimetype = RESPONSE_BODIES[key]
+    variants = snapshot_body(snap, key + variant, lambda: encode(snap, *variant))
+    return variant_response(variants, mimetype)
+
+
+def variant_response(variants, mimetype):
+    coding = request.accept_encodings.best_match(
+        [c for c in ("br", "gzip") if c in variants], default="identity"
+    )
+    body, etag = variants[coding]
+    resp = Response(body, mimetype=mimetype, headers=BODY_HEADERS)
+    if coding != "identity":
+        resp.headers["Content-Encoding"] = coding
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
+def warm_response_bodies(snap):
+    for key in WARM_BODIES:
+        encode = RESPONSE_BODIES[key][0]
+        snapshot_body(snap, key, lambda: encode(snap))
+
+SNAPSHOT_WARMERS.append(warm_response_bodies)
+
+# =================================================
+# INSTRUMENTATION (PROMETHEUS TEXT FORMAT)
+# =================================================
+# Latency histograms for pipeline stages and routes, plus counters and
+# gauges read from the stats dicts the rest of the app already keeps.
+# Recording is a bisect and a locked add, cheap enough to leave on.
+#
+# Each worker also drops its numbers into SNAPSHOT_PATH.metrics.<pid> every
+# few seconds, and GET /metrics sums the live workers' files with its own,
+# so a scrape that lands on any worker reports the whole host.
+
+METRIC_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_FLUSH = 5   # s between per-worker metric files
+METRICS_PREFIX = SNAPSHOT_PATH + ".metrics." if SNAPSHOT_PATH else ""
+
+_HISTOGRAMS = {}    # (metric, labels) -> [bucket counts..., +Inf count, sum]
+_METRICS_LOCK = threading.Lock()
+_METRICS_FLUSHED = {"at": 0.0}
+
+def observe(stage, seconds):
+    _observe(("slrelay_stage_duration_seconds", (("stage", stage),)), seconds)
+
+
+def _observe(key, seconds):
+    i = bisect.bisect_left(METRIC_BUCKETS, seconds)
+    with _METRICS_LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = _HISTOGRAMS[key] = [0] * (len(METRIC_BUCKETS) + 1) + [0.0]
+        h[i] += 1
+        h[-1] += seconds
+
+
+def timed(stage, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def timed_rows(rows, spent):
+    """Pass rows through, adding the time spent producing them to spent[0]."""
+    clock = time.perf_counter
+    rows = iter(rows)
+    while True:
+        t = clock()
+        row = next(rows, None)
+        spent[0] += clock() - t
+        if row is None:
+            return
+        yield row
+
+
+def resident_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def process_metrics():
+    """This worker's additive numbers: histograms, counters, summable gauges."""
+    with _METRICS_LOCK:
+        histograms = [[m, list(labels), list(h)] for (m, labels), h in _HISTOGRAMS.items()]
+    with _HITS_LOCK:
+        hit_entries = len(_HITS_CACHE)
+
+    counters = [
+        ("slrelay_feed_fetches_total", (), FEED_STATS["fetches"]),
+        ("slrelay_feed_failures_total", (), FEED_STATS["failures"]),
+        ("slrelay_feed_retries_total", (), FEED_STATS["retries"]),
+        ("slrelay_feed_breaker_rejections_total", (), FEED_STATS["breaker_rejections"]),
+        ("slrelay_cache_requests_total", (("cache", "hits"), ("result", "hit")), HITS_STATS["hits"]),
+        ("slrelay_cache_requests_total", (("cache", "hits"), ("result", "miss")), HITS_STATS["misses"]),
+        ("slrelay_cache_requests_total", (("cache", "snapshot"), ("result", "hit")), DERIVED_STATS["hits"]),
+        ("slrelay_cache_requests_total", (("cache", "snapshot"), ("result", "miss")), DERIVED_STATS["misses"]),
+        ("slrelay_cache_evictions_total", (("cache", "hits"),), HITS_STATS["evictions"]),
+    ]
+    counters += [
+        ("slrelay_ingest_rows_total", (("result", k),), v) for k, v in INGEST_STATS.items()
+    ]
+    counters += [
+        ("slrelay_room_vibe_total", (("result", k),), v) for k, v in ROOM_STATS.items()
+    ]
+    gauges = [
+        ("slrelay_resident_memory_bytes", (), resident_memory()),
+        ("slrelay_hit_cache_entries", (), hit_entries),
+        ("slrelay_ingest_buffered_rows", (), len(_INGEST)),
+        ("slrelay_feed_breaker_open", (), int(FEED_STATS["breaker_open_until"] > time.time())),
+    ]
+    return {
+        "histograms": histograms,
+        "counters": [[m, list(l), v] for m, l, v in counters],
+        "gauges": [[m, list(l), v] for m, l, v in gauges],
+    }
+
+
+def flush_metrics(force=False):
+    if not METRICS_PREFIX or (not force and time.time() - _METRICS_FLUSHED["at"] < METRICS_FLUSH):
+        return
+    _METRICS_FLUSHED["at"] = time.time()
+    path = METRICS_PREFIX + str(os.getpid())
+    try:
+        with os.fdopen(open_private(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC), "w") as f:
+            json.dump(process_metrics(), f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        app.logger.exception("could not write %s", path)
+
+
+def worker_metrics():
+    """process_metrics() of every live worker on the host, this one included."""
+    found = [process_metrics()]
+    if not METRICS_PREFIX:
+        return found
+
+    folder = os.path.dirname(METRICS_PREFIX) or "."
+    base = os.path.basename(METRICS_PREFIX)
+    for name in os.listdir(folder):
+        pid = name[len(base):]
+        if not name.startswith(base) or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        path = os.path.join(folder, name)
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            try:
+                os.unlink(path)   # worker is gone; its counters go with it
+            except OSError:
+                pass
+            continue
+        except PermissionError:
+            pass
+        try:
+            with os.fdopen(open_private(path)) as f:
+                found.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return found
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+METRIC_HELP = {
+    "slrelay_stage_duration_seconds": ("histogram", "Time spent per pipeline stage."),
+    "slrelay_request_duration_seconds": ("histogram", "Time spent per route, method and status."),
+    "slrelay_feed_fetches_total": ("counter", "Feed fetches attempted (breaker rejections excluded)."),
+    "slrelay_feed_failures_total": ("counter", "Feed fetches that failed after retries."),
+    "slrelay_feed_retries_total": ("counter", "Feed request retries."),
+    "slrelay_feed_breaker_rejections_total": ("counter", "Refreshes skipped by the open feed breaker."),
+    "slrelay_cache_requests_total": ("counter", "Cache lookups by cache and result."),
+    "slrelay_cache_evictions_total": ("counter", "Cache evictions."),
+    "slrelay_ingest_rows_total": ("counter", "Pushed rows by outcome."),
+    "slrelay_room_vibe_total": ("counter", "Room readings: cached, updated from the scanner's last room, or summed in full."),
+    "slrelay_resident_memory_bytes": ("gauge", "Resident memory, summed over workers."),
+    "slrelay_hit_cache_entries": ("gauge", "Entries in the hit caches, summed over workers."),
+    "slrelay_ingest_buffered_rows": ("gauge", "Pushed rows waiting for the aggregator."),
+    "slrelay_feed_breaker_open": ("gauge", "Workers whose feed breaker is open."),
+    "slrelay_workers": ("gauge", "Workers included in this scrape."),
+    "slrelay_snapshot_age_seconds": ("gauge", "Seconds since the served snapshot was built."),
+    "slrelay_feed_pass_age_seconds": ("gauge", "Seconds since the served snapshot's last full feed pass."),
+    "slrelay_snapshot_profiles": ("gauge", "Profiles in the served snapshot."),
+    "slrelay_snapshot_rows": ("gauge", "Feed and pushed rows behind the served snapshot."),
+    "slrelay_snapshot_file_bytes": ("gauge", "Size of the shared snapshot file."),
+}
+
+
+def render_metrics():
+    workers = worker_metrics()
+    histograms, values = {}, defaultdict(float)
+    for w in workers:
+        for metric, labels, h in w["histograms"]:
+            key = (metric, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                total[i] += v
+        for metric, labels, v in w["counters"] + w["gauges"]:
+            values[(metric, tuple(map(tuple, labels)))] += v
+
+    snap = CACHE["snapshot"]
+    now = time.time()
+    values[("slrelay_workers", ())] = len(workers)
+    if snap is not None:
+        values[("slrelay_snapshot_age_seconds", ())] = now - snap["ts"]
+        values[("slrelay_feed_pass_age_seconds", ())] = now - snap.get("full_ts", snap["ts"])
+        values[("slrelay_snapshot_profiles", ())] = len(snap["profiles"])
+        values[("slrelay_snapshot_rows", ())] = snap.get("rows", 0)
+    if SNAPSHOT_PATH:
+        try:
+            values[("slrelay_snapshot_file_bytes", ())] = os.path.getsize(SNAPSHOT_PATH)
+        except OSError:
+            pass
+
+    series = defaultdict(list)
+    for (metric, labels), h in sorted(histograms.items()):
+        cumulative = 0
+        for le, count in zip(METRIC_BUCKETS + ("+Inf",), h[:-1]):
+            cumulative += count
+            series[metric].append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+        series[metric].append(f"{metric}_sum{_labels(labels)} {h[-1]}")
+        series[metric].append(f"{metric}_count{_labels(labels)} {cumulative}")
+    for (metric, labels), v in sorted(values.items()):
+        series[metric].append(f"{metric}{_labels(labels)} {int(v) if v == int(v) else v}")
+
+    lines = []
+    for metric, samples in series.items():
+        kind, text = METRIC_HELP.get(metric, ("untyped", metric))
+        lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"] + samples
+    return "\n".join(lines) + "\n"
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "(unmatched)"
+        labels = (("route", route), ("method", request.method), ("status", str(response.status_code)))
+        _observe(("slrelay_request_duration_seconds", labels), time.perf_counter() - started)
+    return response
+
+# =================================================
+# ON-DEMAND PROFILING (COLLAPSED STACKS)
+# =================================================
+# Off unless configured. A request carrying X-Profile: <PROFILE_SECRET> gets
+# its profile back in place of the normal body. PROFILE_SAMPLE_RATE profiles
+# that share of requests and snapshot rebuilds in the background and keeps
+# the results: the last PROFILE_KEEP per worker under /debug/profiles (same
+# header), and every one as a file in PROFILE_DIR when that is set.
+#
+# A sampler thread reads the profiled thread's stack every PROFILE_INTERVAL
+# and weights it by the microseconds since the previous sample. Output is
+# collapsed stacks ("root;caller;callee <us>" per line), which flamegraph.pl,
+# speedscope and inferno read as-is.
+
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))   # 0..1
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.002))     # s between samples
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+
+_PROFILES = deque(maxlen=PROFILE_KEEP)   # (record, folded), newest last
+_PROFILING = set()                       # threads that already have a sampler
+_PROFILES_LOCK = threading.Lock()
+
+
+class StackSampler:
+    """Collapsed-stack profile of one thread, sampled from another."""
+
+    def __init__(self, ident, interval=PROFILE_INTERVAL):
+        self.ident = ident
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.samples = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.started = self._last = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += max(1, round((now - self._last) * 1e6))
+                self.samples += 1
+            self._last = now
+
+    def folded(self):
+        return "".join(f"{stack} {us}\n" for stack, us in sorted(self.stacks.items()))
+
+
+def profile_sampled():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    """A sampler on the calling thread, or None if it is already being profiled."""
+    ident = threading.get_ident()
+    with _PROFILES_LOCK:
+        if ident in _PROFILING:
+            return None
+        _PROFILING.add(ident)
+    return StackSampler(ident).start()
+
+
+def finish_profile(sampler, name):
+    """Stop sampler and keep its profile; (record, folded)."""
+    sampler.stop()
+    folded = sampler.folded()
+    slug = re.sub(r"[^\w.-]+", "_", name).strip("_")
+    record = {
+        "id": f"{time.time_ns()}-{os.getpid()}-{slug}",
+        "name": name,
+        "ts": time.time(),
+        "pid": os.getpid(),
+        "seconds": round(sampler.seconds, 6),
+        "samples": sampler.samples,
+    }
+    with _PROFILES_LOCK:
+        _PROFILING.discard(sampler.ident)
+        _PROFILES.append((record, folded))
+
+    if PROFILE_DIR:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, record["id"] + ".folded"), "w") as f:
+                f.write(folded)
+        except OSError:
+            app.logger.exception("could not write profile to %s", PROFILE_DIR)
+    return record, folded
+
+
+def profiled(name, fn, *args):
+    """fn(*args), profiled if this call is sampled."""
+    sampler = start_profile() if profile_sampled() else None
+    try:
+        return fn(*args)
+    finally:
+        if sampler is not None:
+            finish_profile(sampler, name)
+
+
+def profile_authorized():
+    supplied = request.headers.get("X-Profile", "")
+    return bool(PROFILE_SECRET and supplied) and hmac.compare_digest(
+        supplied.encode(), PROFILE_SECRET.encode()
+    )
+
+
+@app.before_request
+def _start_request_profile():
+    if request.path.startswith("/debug/"):
+        return
+    on_demand = profile_authorized()
+    if on_demand or profile_sampled():
+        sampler = start_profile()
+        if sampler is not None:
+            g.profile = (sampler, on_demand)
+
+
+@app.after_request
+def _finish_request_profile(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+
+    sampler, on_demand = profile
+    route = request.url_rule.rule if request.url_rule is not None else "(unmatched)"
+    record, folded = finish_profile(sampler, f"{request.method} {route}")
+    if not on_demand:
+        return response
+    return Response(folded, content_type="text/plain; charset=utf-8", headers={
+        "X-Profile-Id": record["id"],
+        "X-Profile-Seconds": str(record["seconds"]),
+        "X-Profile-Status": str(response.status_code),
+    })
+
+
+@app.teardown_request
+def _drop_request_profile(exc):
+    # only left over if the response never made it through after_request
+    profile = g.pop("profile", None)
+    if profile is not None:
+        finish_profile(profile[0], f"{request.method} {request.path} (failed)")
+
+# =================================================
+# ROOM VIBE CACHE
+# =================================================
+# Scanners post their room every few seconds, mostly unchanged. Room tallies
+# are cached per snapshot version under a digest of the sorted member set,
+# and each scanner (X-SecondLife-Object-Key; callers without one share "")
+# remembers its last reading. The same room again gets the same body back; a
+# room that gained or lost fewer avatars than it has is worked out from the
+# scanner's last tally by adding and subtracting only those members' shares.
+#
+# The adjective rotates per scanner, and only when its reading is recomputed,
+# so what a scanner sees doesn't depend on what other rooms asked meanwhile.
+
+ROOM_CACHE_SIZE = 4096      # room tallies kept for the current snapshot
+ROOM_SCANNERS_MAX = 4096    # scanners whose last reading is remembered
+
+ROOM_STATS = {"hit": 0, "delta": 0, "full": 0}
+
+_ROOMS = {"version": None, "tallies": OrderedDict(), "scanners": OrderedDict()}
+_ROOMS_LOCK = threading.Lock()
+
+
+class RoomReading:
+    """A scanner's last room: which snapshot and members, and what it was told."""
+
+    __slots__ = ("version", "digest", "members", "tally", "adjective", "body")
+
+    def __init__(self, version, digest, members, tally, adjective, body):
+        self.version = version
+        self.digest = digest
+        self.members = members
+        self.tally = tally
+        self.adjective = adjective
+        self.body = body
+
+
+def room_digest(members):
+    return hashlib.blake2b("\n".join(sorted(members)).encode(), digest_size=16).digest()
+
+
+def room_vibe_body(snap, members, scanner=""):
+    """Encoded /room/vibe response; members is a frozenset of profiled uuids."""
+    version = snap["version"]
+    digest = room_digest(members)
+
+    with _ROOMS_LOCK:
+        if _ROOMS["version"] is None or version > _ROOMS["version"]:
+            _ROOMS["version"] = version
+            _ROOMS["tallies"].clear()
+        last = _ROOMS["scanners"].get(scanner)
+        if last is not None and last.version == version and last.digest == digest:
+            ROOM_STATS["hit"] += 1
+            _ROOMS["scanners"].move_to_end(scanner)
+            return last.body
+        # a request still holding an older snapshot computes uncached
+        tallies = _ROOMS["tallies"] if _ROOMS["version"] == version else None
+        tally = tallies.get(digest) if tallies is not None else None
+
+    if tally is not None:
+        how = "hit"
+    elif last is not None and last.version == version and (
+        len(last.members ^ members) < len(members)
+    ):
+        index = snap["index"]
+        tally = list(last.tally)
+        for uids, sign in ((last.members - members, -1), (members - last.members, 1)):
+            for u in uids:
+                for i, v in enumerate(room_share(index[u])):
+                    tally[i] += sign * v
+        tally, how = tuple(tally), "delta"
+    else:
+        index = snap["index"]
+        tally, how = room_tally([index[u] for u in members]), "full"
+
+    pretty, _, adjective = room_vibe_text(tally, last.adjective if last is not None else None)
+    body = json.dumps({
+        "pretty_text": pretty   # ← ONLY thing SL needs
+    }, ensure_ascii=False).encode("utf-8")
+
+    with _ROOMS_LOCK:
+        ROOM_STATS[how] += 1
+        if tallies is not None and _ROOMS["version"] == version:
+            tallies[digest] = tally
+            tallies.move_to_end(digest)
+            if len(tallies) > ROOM_CACHE_SIZE:
+                tallies.popitem(last=False)
+        scanners = _ROOMS["scanners"]
+        scanners[scanner] = RoomReading(version, digest, members, tally, adjective, body)
+        scanners.move_to_end(scanner)
+        if len(scanners) > ROOM_SCANNERS_MAX:
+            scanners.popitem(last=False)
+    return body
+
 # =================================================
 # ROOM VIBE ENDPOINT (SL-SAFE, PROFILE-STYLE)
 # =================================================
@@ -785,17 +3498,12 @@ def room_vibe():
     else:
         uuids = set()
 
-    profiles = [
-        p for p in build_profiles()
-        if p["avatar_uuid"] in uuids
-    ]
-
-    pretty, html = build_room_vibe_enhanced(profiles)
+    snap = current_snapshot()
+    index = snap["index"]
+    members = frozenset(u for u in uuids if u in index)
 
     return Response(
-        json.dumps({
-            "pretty_text": pretty   # ← ONLY thing SL needs
-        }, ensure_ascii=False),
+        room_vibe_body(snap, members, request.headers.get("X-SecondLife-Object-Key", "")),
         mimetype="application/json; charset=utf-8"
     )
 
@@ -804,26 +3512,52 @@ def best_match():
     data = request.get_json(silent=True) or {}
     uuid = data.get("uuid")
 
-    profiles = build_profiles()
-    source = next((p for p in profiles if p["avatar_uuid"] == uuid), None)
+    snap = current_snapshot()
+    source = snap["index"].get(uuid)
 
     if not source:
         return jsonify({"error": "profile not found"}), 404
 
-    similar, complement, hybrid = find_best_matches(source, profiles)
+    try:
+        k = int(data.get("k", 1))
+    except (TypeError, ValueError):
+        k = 0
+    if not 1 <= k <= MATCH_MAX_K:
+        return jsonify({"error": f"k must be an integer from 1 to {MATCH_MAX_K}"}), 400
+
+    similar, complement, hybrid = find_top_matches(snap, source, k)
+
+    if "k" not in data:
+        # original single-match card, kept byte-for-byte for existing HUDs
+        pretty = build_best_match_pretty(
+            source,
+            similar[0][0] if similar else None,
+            complement[0][0] if complement else None,
+            hybrid[0][0] if hybrid else None
+        )
 
-    pretty = build_best_match_pretty(
-        source,
-        similar,
-        complement,
-        hybrid
-    )
+        # 🔑 SL-SAFE RESPONSE (THIS IS WHY IT WORKS)
+        return Response(
+            json.dumps({
+                "text": pretty,        # Script C reads this
+                "pretty_text": pretty  # kept for consistency
+            }, ensure_ascii=False),
+            mimetype="application/json; charset=utf-8"
+        )
+
+    pretty = build_topk_match_pretty(source, similar, complement, hybrid)
 
-    # 🔑 SL-SAFE RESPONSE (THIS IS WHY IT WORKS)
     return Response(
         json.dumps({
-            "text": pretty,        # Script C reads this
-            "pretty_text": pretty  # kept for consistency
+            "text": pretty,
+            "pretty_text": pretty,
+            "matches": {
+                kind: [
+                    {"name": p["name"], "uuid": p["avatar_uuid"], "score": round(sc, 1)}
+                    for p, sc in matches
+                ]
+                for kind, matches in (("similar", similar), ("complement", complement), ("hybrid", hybrid))
+            }
         }, ensure_ascii=False),
         mimetype="application/json; charset=utf-8"
     )
@@ -835,51 +3569,44 @@ def best_match():
 @app.route("/profile/self", methods=["POST"])
 def profile_self():
     data = request.get_json(silent=True) or {}
-    uuid = data.get("uuid")
-    for p in build_profiles():
-        if p["avatar_uuid"] == uuid:
-            return Response(json.dumps(p, ensure_ascii=False), mimetype="application/json; charset=utf-8")
+    snap = current_snapshot()
+    p = snap["index"].get(data.get("uuid"))
+    if p:
+        return Response(json.dumps(with_card(snap, p), ensure_ascii=False), mimetype="application/json; charset=utf-8")
     return jsonify({"error": "profile not found"}), 404
 
 @app.route("/profile/<uuid>", methods=["GET"])
 def profile_by_uuid(uuid):
-    for p in build_profiles():
-        if p["avatar_uuid"] == uuid:
-            return Response(json.dumps(p, ensure_ascii=False), mimetype="application/json; charset=utf-8")
+    snap = current_snapshot()
+    p = snap["index"].get(uuid)
+    if p:
+        return Response(json.dumps(with_card(snap, p), ensure_ascii=False), mimetype="application/json; charset=utf-8")
     return jsonify({"error": "profile not found"}), 404
 
 @app.route("/profiles/available", methods=["POST"])
 def profiles_available():
     data = request.get_json(silent=True) or {}
-    uuids = set(data.get("uuids", []))
+    uuids = dict.fromkeys(data.get("uuids", []))   # dedupe, keep request order
+    index = profile_index()
     return Response(
-        json.dumps([{"name":p["name"],"uuid":p["avatar_uuid"]} for p in build_profiles() if p["avatar_uuid"] in uuids], ensure_ascii=False),
+        json.dumps([{"name":index[u]["name"],"uuid":u} for u in uuids if u in index], ensure_ascii=False),
         mimetype="application/json; charset=utf-8"
     )
 
 @app.route("/leaderboard")
 def leaderboard():
-    return Response(json.dumps(build_profiles()), mimetype="application/json", headers={"Access-Control-Allow-Origin":"*"})
+    # profile cards are only rendered for callers that ask (?cards=1)
+    cards = request.args.get("cards", "").lower() in ("1", "true")
+    return cached_response(current_snapshot(), ("leaderboard", cards))
 
 @app.route("/leaderboard/sl")
 def leaderboard_sl():
-
-    profiles = build_profiles()
-    pretty = build_leaderboard_pretty(profiles)
-
-    return Response(
-        json.dumps({
-            "pretty_text": pretty
-        }, ensure_ascii=False),
-        mimetype="application/json; charset=utf-8",
-        headers={"Access-Control-Allow-Origin": "*"}
-    )
+    return cached_response(current_snapshot(), ("leaderboard_sl",))
 
 @app.route("/leaderboard/panels")
 def leaderboard_panels():
 
-    profiles = build_profiles()
-    ranked = sorted(profiles, key=lambda p: p["confidence"], reverse=True)[:3]
+    ranked = leaderboard_rankings(current_snapshot())["confidence"]
 
     def card(pos, p, color):
         medal = ["🥇","🥈","🥉"][pos]
@@ -1015,49 +3742,74 @@ def leaderboard_panels():
 @app.route("/leaderboard/live", methods=["GET"])
 def leaderboard_live():
 
-    profiles = build_profiles()
+    snap = current_snapshot()
 
-    if not profiles:
+    if not snap["profiles"]:
         return jsonify({"trait":"None","top":[]})
 
-    # Rotate trait here if you want later
-    trait_key = "confidence"
-    trait_label = "Confidence"
-
-    # Rank top 3
-    ranked = sorted(
-        profiles,
-        key=lambda p: p["confidence"],
-        reverse=True
-    )[:3]
-
-    top = [
-        {
-            "name": p["name"],
-            "score": p["confidence"]
-        }
-        for p in ranked
-    ]
-
-    return Response(
-        json.dumps({
-            "trait": trait_label,
-            "top": top
-        }, ensure_ascii=False),
-        mimetype="application/json; charset=utf-8",
-        headers={"Access-Control-Allow-Origin": "*"}
-    )
+    return cached_response(snap, ("leaderboard_live",))
     
 @app.route("/metrics/platform", methods=["GET"])
 def platform_metrics():
+    current_snapshot()
+    variants = platform_metrics_variants(current_activity(), activity_bucket(time.time()))
+    return variant_response(variants, "application/json")
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    # HUDs push chat-activity rows here: a JSON list, or {"rows": [...]}
+    if not INGEST_TOKEN:
+        # the only write path; without a token anyone could forge any avatar's rows
+        return jsonify({"error": "ingest is disabled (INGEST_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(
+        request.headers.get("X-Ingest-Token", "").encode(), INGEST_TOKEN.encode()
+    ):
+        return jsonify({"error": "unauthorized"}), 401
+
+    data = request.get_json(silent=True)
+    rows = data.get("rows") if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "expected a non-empty list of rows"}), 400
+    if len(rows) > INGEST_MAX_BATCH:
+        return jsonify({"error": f"at most {INGEST_MAX_BATCH} rows per request"}), 413
 
-    metrics = build_platform_metrics()
-
-    return Response(
-        json.dumps(metrics),
-        mimetype="application/json",
-        headers={"Access-Control-Allow-Origin": "*"}
-    )
+    now = time.time()
+    try:
+        rows = [normalize_pushed_row(r, now) for r in rows]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ingest_rows(rows)
+    ensure_refresher()
+    return jsonify({"accepted": len(rows)}), 202
+
+@app.route("/metrics", methods=["GET"])
+def metrics_prometheus():
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/debug/profiles", methods=["GET"])
+def debug_profiles():
+    # this worker's recent profiles, newest first; PROFILE_DIR has every worker's
+    if not profile_authorized():
+        return jsonify({"error": "not found"}), 404
+    with _PROFILES_LOCK:
+        records = [record for record, _ in reversed(_PROFILES)]
+    return jsonify({"profiles": records})
+
+@app.route("/debug/profiles/<profile_id>", methods=["GET"])
+def debug_profile(profile_id):
+    if not profile_authorized():
+        return jsonify({"error": "not found"}), 404
+    with _PROFILES_LOCK:
+        folded = next((f for record, f in _PROFILES if record["id"] == profile_id), None)
+    if folded is None:
+        return jsonify({"error": "not found"}), 404
+    return Response(folded, content_type="text/plain; charset=utf-8")
+
+@app.route("/metrics/feed", methods=["GET"])
+def metrics_feed():
+    # this worker's view; followers never fetch, so only the leader's counters move
+    return jsonify(feed_stats())
 
 @app.route("/metrics/panels")
 def metrics_panels():
@@ -1181,6 +3933,10 @@ def metrics_panels():
 def ok():
     return "OK", 200
 
+
+start_scoring_pool()
+warm_start()
+
 # ==========================================
 # REQUIRED FOR RENDER
 # ==========================================
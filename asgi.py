@@ -0,0 +1,177 @@
+"""
+ASGI entry point: the same routes as app.py, served from an event loop.
+
+    uvicorn asgi:app --workers 2
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 2
+
+Request bodies are read asynchronously, so thousands of slow or idle
+in-world clients cost a coroutine each instead of a worker. Responses that
+are already encoded for the current snapshot (the leaderboard bodies the
+warmers prepare) are served inline on the loop; every other view runs on a
+bounded thread pool, since some of them render, compress, take file locks
+or wait on the feed. Feed refreshes run on the refresher thread app.py
+starts, never on the loop.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as relay
+
+MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", 1 << 20))   # bytes; /ingest batches are far smaller
+VIEW_THREADS = int(os.environ.get("ASGI_VIEW_THREADS", 8))   # views that can't answer inline
+
+_VIEWS = ThreadPoolExecutor(VIEW_THREADS, thread_name_prefix="asgi-view")
+
+# GET path -> response body key in app.RESPONSE_BODIES
+READY_BODIES = {
+    "/leaderboard/sl": lambda query: ("leaderboard_sl",),
+    "/leaderboard/live": lambda query: ("leaderboard_live",),
+    "/leaderboard": lambda query: (
+        "leaderboard", query.get("cards", [""])[-1].lower() in ("1", "true")
+    ),
+}
+
+
+# =================================================
+# ASGI <-> WSGI
+# =================================================
+
+def wsgi_environ(scope, body):
+    root = scope.get("root_path", "")
+    path = scope["path"]
+    if root and path.startswith(root):
+        path = path[len(root):]
+    server = scope.get("server") or ("localhost", None)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or (443 if scope.get("scheme") == "https" else 80)),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in scope.get("headers", ()):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_LENGTH":
+            continue
+        if key != "CONTENT_TYPE":
+            key = "HTTP_" + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_flask(environ):
+    """Run one request through the Flask app; (status, headers, body)."""
+    started = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return chunks.append
+
+    result = relay.app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in started["headers"]]
+    return started["status"], headers, b"".join(chunks)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive):
+    """The whole request body, or None if the client went away."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY:
+            raise BodyTooLarge
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+def answers_inline(environ):
+    """True if the view will only look up a body that is already encoded."""
+    snap = relay.CACHE["snapshot"]
+    body_key = READY_BODIES.get(environ["PATH_INFO"])
+    if snap is None or body_key is None or environ["REQUEST_METHOD"] != "GET":
+        return False
+    return relay.body_ready(snap, body_key(parse_qs(environ["QUERY_STRING"])))
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+# =================================================
+# APP
+# =================================================
+
+async def lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # load (or build) the first snapshot before taking traffic
+            try:
+                await loop.run_in_executor(_VIEWS, relay.current_snapshot)
+            except Exception:
+                relay.app.logger.exception("no snapshot at startup; first requests will retry")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    try:
+        body = await read_body(receive)
+    except BodyTooLarge:
+        return await send_response(
+            send, 413, [(b"content-type", b"application/json")], b'{"error": "request body too large"}'
+        )
+    if body is None:
+        return
+
+    environ = wsgi_environ(scope, body)
+    if answers_inline(environ):
+        status, headers, payload = call_flask(environ)
+    else:
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            _VIEWS, call_flask, environ
+        )
+    await send_response(send, status, headers, payload)
@@ -0,0 +1,388 @@
+"""
+Offline benchmark for the scoring pipeline.
+
+    python bench.py                                  # 1k, 10k, 100k and 1M rows
+    python bench.py --sizes 1k,10k --out before.json
+    python bench.py --compare before.json after.json
+
+Each size runs in its own process against a generated gviz feed served from
+127.0.0.1, so nothing touches the real sheet and memory numbers are not
+polluted by the previous size. The generator is deterministic: the same
+seed and knobs give byte-identical feeds, and timestamps are relative to a
+fixed clock, so runs on different days land in the same decay buckets.
+Results are written as JSON (one entry per size, one record per stage).
+"""
+
+import argparse
+import http.server
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+FIXED_NOW = 1_700_000_000          # the clock every generated row is aged against
+ROW_AGES = (30, 200, 1000, 5000, 40000, 200000)   # seconds; spans every decay bucket
+MESSAGE_COUNTS = (0, 1, 2, 5, 25)
+FILLER = (
+    "the a and you me it is was going to be here there so just really "
+    "today tonight sim club music dance back brb afk ok yeah nah well"
+).split()
+EXTRA_EMOJI = ("🙂", "🔥", "✨", "🎶", "👀", "🙈", "💃", "🥂")
+GVIZ_COLUMNS = ("avatar_uuid", "display_name", "timestamp", "messages", "context_sample")
+
+# =================================================
+# FEED GENERATOR
+# =================================================
+
+def vocabulary():
+    """(slang, phrases, emoji, filler) drawn from the live lexicons."""
+    import app as relay
+
+    slang, phrases, emoji = set(), set(), set(EXTRA_EMOJI)
+    for words in relay.LEXICONS.values():
+        for w in words:
+            tokens = relay.TOKEN_RE.findall(w.lower())
+            if len(tokens) > 1:
+                phrases.add(w)
+            elif tokens and not tokens[0][0].isalnum():
+                emoji.add(w)
+            elif tokens:
+                slang.add(w)
+    lexical = slang | {w.lower() for w in relay.NEGATORS}
+    filler = [w for w in FILLER if w not in lexical]
+    return sorted(slang), sorted(phrases), sorted(emoji), filler
+
+
+def generate_feed(rows, avatars, seed=1, slang=0.25, emoji=0.05, phrases=0.05,
+                  max_words=16, now=FIXED_NOW, vocab=None):
+    """
+    A gviz response body (bytes) with `rows` rows spread over `avatars`
+    avatars. slang/emoji/phrases are per-token probabilities of drawing a
+    lexicon word, an emoji or a multi-word lexicon phrase instead of filler.
+    """
+    rnd = random.Random(seed)
+    slang_words, phrase_words, emoji_words, filler = vocab or vocabulary()
+    emoji_cut = emoji
+    phrase_cut = emoji_cut + phrases
+    slang_cut = phrase_cut + slang
+
+    def token():
+        r = rnd.random()
+        if r < emoji_cut:
+            return rnd.choice(emoji_words)
+        if r < phrase_cut:
+            return rnd.choice(phrase_words)
+        if r < slang_cut:
+            return rnd.choice(slang_words)
+        return rnd.choice(filler)
+
+    out = [
+        '/*O_o*/\ngoogle.visualization.Query.setResponse({"version":"0.6","reqId":"0",'
+        '"status":"ok","sig":"1","table":{"cols":',
+        json.dumps([{"id": c.upper(), "label": c, "type": "string"} for c in GVIZ_COLUMNS]),
+        ',"rows":[',
+    ]
+    for i in range(rows):
+        a = rnd.randrange(avatars)
+        ts = now - rnd.choice(ROW_AGES) - rnd.random() * 50
+        text = " ".join(token() for _ in range(rnd.randrange(max_words + 1)))
+        cells = [
+            {"v": f"bench-{a:07d}"},
+            {"v": f"Avatar {a}"},
+            {"v": round(ts, 3)},
+            {"v": rnd.choice(MESSAGE_COUNTS)},
+            {"v": text} if text else None,
+        ]
+        out.append(("," if i else "") + json.dumps({"c": cells}, ensure_ascii=False))
+    out.append("]}});")
+    return "".join(out).encode()
+
+
+def edit_feed(body, fraction, seed=2):
+    """The same feed with `fraction` of its non-empty context samples rewritten."""
+    rnd = random.Random(seed)
+    prefix, _, rest = body.partition(b',"rows":[')
+    rows = json.loads(b"[" + rest[:-len(b"]}});")] + b"]")
+    for r in rows:
+        cell = r["c"][4]
+        if cell is not None and rnd.random() < fraction:
+            cell["v"] = cell["v"] + " edited"
+    return (
+        prefix + b',"rows":' + json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode()
+        + b"}});"
+    )
+
+# =================================================
+# LOCAL FEED
+# =================================================
+
+class FeedServer:
+    """Serves whatever body is current at 127.0.0.1:<ephemeral port>."""
+
+    def __init__(self):
+        feed = self
+        self.body = b""
+        self.hits = 0
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                feed.hits += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(feed.body)))
+                self.end_headers()
+                self.wfile.write(feed.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+# =================================================
+# ONE SIZE (RUNS IN A FRESH PROCESS)
+# =================================================
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024   # KiB on Linux
+
+
+def run_size(cfg):
+    # no shared store, no real sheet: this process only ever sees the local feed
+    os.environ["SNAPSHOT_PATH"] = ""
+    os.environ["GOOGLE_PROFILES_FEED"] = ""
+    import app as relay
+
+    # keep the background refresher out of AGG while we drive it by hand
+    relay._REFRESH_LOCK.acquire()
+    relay.app.logger.disabled = True
+
+    rows, seed = cfg["rows"], cfg["seed"]
+    avatars = cfg["avatars"] or max(10, rows // cfg["rows_per_avatar"])
+    vocab = vocabulary()
+    body = generate_feed(
+        rows, avatars, seed, cfg["slang"], cfg["emoji"], cfg["phrases"], cfg["max_words"],
+        vocab=vocab,
+    )
+    feed = FeedServer()
+    feed.body = body
+    relay.GOOGLE_PROFILES_FEED = feed.url
+
+    stages = {}
+    baseline = relay.resident_memory()
+
+    def stage(name, fn, units, count=None, repeat=1):
+        # read-only stages report the best of `repeat` runs; passes that move AGG run once
+        spent = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            spent = min(spent, time.perf_counter() - started)
+        n = result if count is None else count
+        stages[name] = {
+            "seconds": round(spent, 6),
+            units: n,
+            f"{units}_per_sec": round(n / spent, 1) if spent else None,
+            "rss_bytes": relay.resident_memory(),
+        }
+        return result
+
+    def stream():
+        return sum(1 for _ in relay.fetch_rows())
+
+    repeat = cfg["repeat"]
+    stage("fetch_parse", stream, "rows", repeat=repeat)
+
+    texts = list(itertools.islice(
+        (t for t in (r.get("context_sample") for r in relay.fetch_rows()) if t), cfg["extract_sample"]
+    ))
+    stage("extract_hits", lambda: sum(1 for t in texts if relay.extract_hits(t) is not None), "texts", repeat=repeat)
+    del texts
+
+    relay._HITS_CACHE.clear()
+    stage("aggregate_cold", lambda: relay.aggregate_rows(relay.fetch_rows(), FIXED_NOW), "rows", rows)
+    after_cold = relay.resident_memory()
+    stage("aggregate_unchanged", lambda: relay.aggregate_rows(relay.fetch_rows(), FIXED_NOW), "rows", rows)
+
+    feed.body = edit_feed(body, cfg["edit_fraction"], seed + 1)
+    del body
+    stage("aggregate_edited", lambda: relay.aggregate_rows(relay.fetch_rows(), FIXED_NOW), "rows", rows)
+
+    profiles = list(relay.AGG["profiles"].values())
+    snap = {
+        "schema": relay.SNAPSHOT_SCHEMA,
+        "profiles": profiles,
+        "index": dict(relay.AGG["profiles"]),
+        "rows": len(relay.AGG["rows"]),
+        "ts": FIXED_NOW,
+        "full_ts": FIXED_NOW,
+        "version": time.time_ns(),
+    }
+
+    rnd = random.Random(seed)
+    sources = [rnd.choice(profiles) for _ in range(cfg["queries"])] if profiles else []
+    stage("match_index", lambda: relay.match_index(snap) and len(profiles), "profiles")
+    stage("find_top_matches", lambda: sum(1 for s in sources if relay.find_top_matches(snap, s)), "queries", repeat=repeat)
+    scans = sources[:max(1, cfg["queries"] // 10)]
+    stage("find_best_matches", lambda: sum(1 for s in scans if relay.find_best_matches(s, profiles)), "queries", repeat=repeat)
+
+    stage("build_leaderboard_pretty", lambda: relay.build_leaderboard_pretty(profiles) and 1, "boards", repeat=repeat)
+
+    room = min(cfg["room_size"], len(profiles))
+    rooms = [rnd.sample(profiles, room) for _ in range(cfg["rooms"])] if room else []
+    stage("build_room_vibe_enhanced", lambda: sum(1 for r in rooms if relay.build_room_vibe_enhanced(r)), "rooms", repeat=repeat)
+
+    return {
+        "rows": rows,
+        "avatars": avatars,
+        "profiles": len(profiles),
+        "feed_bytes": len(feed.body),
+        "feed_requests": feed.hits,
+        "stages": stages,
+        "memory": {
+            "baseline_rss_bytes": baseline,
+            "aggregated_rss_bytes": after_cold,
+            "final_rss_bytes": relay.resident_memory(),
+            "peak_rss_bytes": peak_rss(),
+        },
+        "hit_cache": dict(relay.HITS_STATS),
+    }
+
+# =================================================
+# DRIVER
+# =================================================
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(args):
+    results = []
+    for rows in map(parse_size, args.sizes.split(",")):
+        cfg = {
+            "rows": rows,
+            "avatars": args.avatars,
+            "rows_per_avatar": args.rows_per_avatar,
+            "seed": args.seed,
+            "slang": args.slang,
+            "emoji": args.emoji,
+            "phrases": args.phrases,
+            "max_words": args.max_words,
+            "edit_fraction": args.edit_fraction,
+            "extract_sample": args.extract_sample,
+            "queries": args.queries,
+            "rooms": args.rooms,
+            "room_size": args.room_size,
+            "repeat": args.repeat,
+        }
+        print(f"== {rows:,} rows", file=sys.stderr, flush=True)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(cfg)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        if proc.returncode:
+            sys.exit(f"benchmark at {rows:,} rows failed (exit {proc.returncode})")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "worker")},
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}", file=sys.stderr)
+
+
+def throughput(record):
+    return next((v for k, v in record.items() if k.endswith("_per_sec")), None)
+
+
+def print_result(result):
+    print(f"{result['rows']:>9,} rows  {result['profiles']:,} profiles  "
+          f"{result['feed_bytes'] / 1e6:.1f} MB feed  "
+          f"peak {result['memory']['peak_rss_bytes'] / 2**20:.0f} MiB")
+    for name, rec in result["stages"].items():
+        rate = throughput(rec)
+        print(f"    {name:<26} {rec['seconds']:>10.4f}s  {rate or 0:>14,.1f}/s")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {r["rows"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["rows"]: r for r in json.load(f)["results"]}
+
+    for rows in sorted(old.keys() & new.keys()):
+        a, b = old[rows], new[rows]
+        print(f"{rows:>9,} rows")
+        for name in (n for n in a["stages"] if n in b["stages"]):
+            before, after = throughput(a["stages"][name]), throughput(b["stages"][name])
+            ratio = f"{after / before:6.2f}x" if before and after else "     -"
+            print(f"    {name:<26} {before or 0:>14,.1f}/s -> {after or 0:>14,.1f}/s  {ratio}")
+        mem_a, mem_b = a["memory"]["peak_rss_bytes"], b["memory"]["peak_rss_bytes"]
+        print(f"    {'peak rss':<26} {mem_a / 2**20:>12.0f}MiB -> {mem_b / 2**20:>12.0f}MiB  "
+              f"{mem_b / mem_a:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="comma-separated row counts (k/m suffixes)")
+    parser.add_argument("--avatars", type=int, default=0, help="fixed avatar count (default: rows / --rows-per-avatar)")
+    parser.add_argument("--rows-per-avatar", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--slang", type=float, default=0.25, help="per-token chance of a lexicon word")
+    parser.add_argument("--emoji", type=float, default=0.05, help="per-token chance of an emoji")
+    parser.add_argument("--phrases", type=float, default=0.05, help="per-token chance of a multi-word phrase")
+    parser.add_argument("--max-words", type=int, default=16, help="longest context_sample, in tokens")
+    parser.add_argument("--edit-fraction", type=float, default=0.01, help="share of rows changed between passes")
+    parser.add_argument("--extract-sample", type=int, default=200_000, help="texts fed straight to extract_hits")
+    parser.add_argument("--queries", type=int, default=200, help="match lookups (full scans run a tenth)")
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--room-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per read-only stage (best is kept)")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two result files and exit")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_size(json.loads(args.worker))))
+    elif args.compare:
+        compare(*args.compare)
+    else:
+        run_all(args)
+
+
+if __name__ == "__main__":
+    main()